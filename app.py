@@ -1,13 +1,14 @@
 import os
 import sys
 import json
+import html
 import time
 import subprocess
 import threading
 import webbrowser
 import psutil
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, stream_with_context
 
 # ==========================================
 # 0. CRITICAL BOOTSTRAP LOGGING
@@ -45,16 +46,18 @@ app.secret_key = "jellydiscover_secure_key_v1"
 # 2. HELPER FUNCTIONS
 # ==========================================
 
-def get_service_status():
+PROCESS_SCAN_TTL = 60  # Seconds a fallback process scan is reused
+_process_scan = {"at": 0.0, "result": (False, False)}
+
+def scan_processes():
     """
-    Checks for Engine AND Cleaner processes.
-    Trusts the ACTUAL process list over files or service managers.
+    Fallback for processes that publish no heartbeat (older builds): walks the process
+    table for Engine / Cleaner, at most once per PROCESS_SCAN_TTL.
     """
+    now = time.time()
+    if now - _process_scan["at"] < PROCESS_SCAN_TTL: return _process_scan["result"]
     engine_alive = False
     cleaner_alive = False
-    service_status = "Stopped"
-    
-    # 1. SCAN PROCESSES
     try:
         for proc in psutil.process_iter(['name', 'cmdline']):
             try:
@@ -73,13 +76,51 @@ def get_service_status():
                 pass
     except Exception:
         pass
+    _process_scan.update(at=now, result=(engine_alive, cleaner_alive))
+    return engine_alive, cleaner_alive
+
+def heartbeat_alive(job, hb):
+    """
+    Fresh heartbeat -> alive. A stale one is settled by its pid: still the process that wrote
+    the file means a hung process (reported alive), anything else means it crashed (the file
+    is marked so this is reported once). PIDs are reused after a reboot/container restart, so
+    the process must have been created before the heartbeat started.
+    """
+    if utils.heartbeat_fresh(hb): return True, False
+    if not hb or hb.get("state") in utils.HEARTBEAT_DONE: return False, False
+    try:
+        pid = hb.get("pid", -1)
+        if pid != os.getpid() and psutil.Process(pid).create_time() <= hb.get("started", 0) + 1: return True, False
+    except: pass
+    try: utils.write_json_atomic(utils.heartbeat_path(job), {**hb, "state": "crashed"})
+    except: pass
+    return False, True
+
+def get_service_status():
+    """
+    Checks for Engine AND Cleaner processes.
+    Reads their heartbeat files (O(1)); the process scan only runs when neither publishes one.
+    """
+    engine_hb = utils.read_heartbeat("engine")
+    cleaner_hb = utils.read_heartbeat("cleaner")
+    crashed = False
+    
+    # 1. HEARTBEATS (Fallback: cached process scan)
+    if engine_hb or cleaner_hb:
+        engine_alive, engine_crashed = heartbeat_alive("engine", engine_hb)
+        cleaner_alive, cleaner_crashed = heartbeat_alive("cleaner", cleaner_hb)
+        crashed = engine_crashed or cleaner_crashed
+    else:
+        engine_alive, cleaner_alive = scan_processes()
 
     # 2. PRIORITY RETURN (Cleaner takes precedence for UI Feedback)
     if cleaner_alive:
         return "Running (Cleaner Active)"
         
     if engine_alive:
-        # Check if it's the Service (Just for labeling)
+        # Label Service vs Manual (the heartbeat says which; sc query only without one)
+        if engine_hb: return f"Running ({'Service' if engine_hb.get('mode') == 'service' else 'Manual'})"
+        service_status = "Stopped"
         if utils.IS_WINDOWS and not utils.IS_DOCKER:
             try:
                 output = subprocess.check_output("sc query JellyDiscover", shell=True).decode().lower()
@@ -88,6 +129,8 @@ def get_service_status():
             except: pass
         return f"Running ({service_status if service_status != 'Stopped' else 'Manual'})"
 
+    if crashed: return "Stopped (Crash Detected)"
+
     # 3. CLEAN GHOST FILES (Crash Recovery)
     if not engine_alive and os.path.exists(utils.STATUS_FILE):
         try:
@@ -164,9 +207,20 @@ def save_config():
         # New: Thread Count (with safe integer conversion)
         try: current_conf['MAX_THREADS'] = int(form.get('max_threads', 2))
         except: current_conf['MAX_THREADS'] = 2
+        try: current_conf['SCORING_PROCESSES'] = max(0, int(form.get('scoring_processes', 0)))
+        except: current_conf['SCORING_PROCESSES'] = 0
 
         try: current_conf['SCHEDULE_FREQ'] = int(form.get('schedule_freq', 24))
         except: current_conf['SCHEDULE_FREQ'] = 24
+
+        # Scheduler cadences for the heavier jobs (0 = off)
+        try: current_conf['CATALOG_RESYNC_HOURS'] = int(form.get('resync_hours', 168))
+        except: current_conf['CATALOG_RESYNC_HOURS'] = 168
+        try: current_conf['MAINTENANCE_HOURS'] = int(form.get('maintenance_hours', 168))
+        except: current_conf['MAINTENANCE_HOURS'] = 168
+
+        # Library refresh strategy (Stable = keep libraries, notify changed paths only)
+        current_conf['STABLE_LIBRARIES'] = form.get('library_mode', 'recreate') == 'stable'
         
         # 2. Port Change Check
         if not utils.IS_DOCKER:
@@ -278,32 +332,61 @@ def action():
         logging.error(f"Action Crash: {e}", exc_info=True)
         return redirect(url_for('index'))
 
+@app.route('/api/progress')
+def api_progress():
+    """
+    Live run progress from the heartbeat files: per job its state, current stage,
+    units done/remaining, throughput, ETA and finished stages. Cheap enough to poll.
+    """
+    now = time.time()
+    jobs = {}
+    for job in ("engine", "cleaner"):
+        hb = utils.read_heartbeat(job)
+        if not hb: continue
+        progress = hb.get("progress") or {}
+        if progress.get("stage_started"): progress["stage_seconds"] = round(now - progress["stage_started"], 1)
+        jobs[job] = {"state": hb.get("state"), "mode": hb.get("mode"), "alive": utils.heartbeat_fresh(hb, now),
+                     "running_seconds": round(now - hb.get("started", now), 1),
+                     "updated_seconds_ago": round(now - (hb.get("updated") or now), 1), "progress": progress}
+    return Response(json.dumps({"status": get_service_status(), "jobs": jobs}), mimetype="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape target: stage timings, HTTP and file counters of the last engine/cleaner runs."""
+    try: body = utils.render_prometheus()
+    except Exception as e:
+        logging.error(f"Metrics Route Crash: {e}", exc_info=True)
+        body = ""
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+LOG_FILES = {"engine": ("Engine Log", "JellyDiscover.log"), "cleaner": ("Cleaner Log", "cleaner.log")}
+LOG_STREAM_SECONDS = 300  # An SSE connection is closed after this; EventSource reconnects with Last-Event-ID
+
+def log_path(key):
+    return os.path.join(utils.LOG_DIR, LOG_FILES[key][1])
+
+def pick_log():
+    """Cleaner log while the cleaner runs (or if it ran more recently), else the engine log."""
+    engine_log, cleaner_log = log_path("engine"), log_path("cleaner")
+    if "Cleaner" in get_service_status(): return "cleaner"
+    if os.path.exists(cleaner_log) and os.path.exists(engine_log):
+        # If cleaner ran more recently than engine, show cleaner
+        if os.path.getmtime(cleaner_log) > os.path.getmtime(engine_log): return "cleaner"
+    return "engine"
+
 @app.route('/logs')
 def view_logs():
-    # Define both log paths
-    engine_log = os.path.join(utils.LOG_DIR, "JellyDiscover.log")
-    cleaner_log = os.path.join(utils.LOG_DIR, "cleaner.log")
-    
-    target_log = engine_log
-    log_name = "Engine Log"
-
-    # LOGIC: If Cleaner is running OR cleaner log is newer, show that instead.
-    status = get_service_status()
-    if "Cleaner" in status:
-        target_log = cleaner_log
-        log_name = "Cleaner Log"
-    elif os.path.exists(cleaner_log) and os.path.exists(engine_log):
-        # If cleaner ran more recently than engine, show cleaner
-        if os.path.getmtime(cleaner_log) > os.path.getmtime(engine_log):
-            target_log = cleaner_log
-            log_name = "Cleaner Log"
+    key = pick_log()
+    target_log = log_path(key)
+    log_name = LOG_FILES[key][0]
             
+    # Only the end of the file is read; new lines then arrive over /logs/stream
     content = ""
+    offset = 0
     try:
         if os.path.exists(target_log):
-            with open(target_log, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()[-100:] 
-                content = "".join(lines)
+            content, offset = utils.tail_log(target_log, 100)
         else:
             content = f"Log file ({log_name}) not found."
     except Exception as e:
@@ -313,19 +396,63 @@ def view_logs():
     <html>
         <head>
             <title>JellyDiscover Logs</title>
-            <meta http-equiv="refresh" content="5"> 
+            <noscript><meta http-equiv="refresh" content="5"></noscript>
         </head>
         <body style="background:#121212; color:#e0e0e0; font-family:monospace; padding:20px;">
             <h2 style="border-bottom:1px solid #333; padding-bottom:10px; display:flex; justify-content:space-between;">
                 <span>Live Log Viewer: <span style="color:#a964da">{log_name}</span></span>
-                <span style="font-size:0.6em; opacity:0.7">Auto-refreshing (5s)</span>
+                <span id="live" style="font-size:0.6em; opacity:0.7">Live</span>
             </h2>
-            <pre style="white-space: pre-wrap; font-size: 13px;">{content}</pre>
-            <script>window.scrollTo(0, document.body.scrollHeight);</script>
+            <pre id="log" style="white-space: pre-wrap; font-size: 13px;">{html.escape(content)}</pre>
+            <script>
+                window.scrollTo(0, document.body.scrollHeight);
+                const log = document.getElementById("log"), live = document.getElementById("live");
+                const source = new EventSource("{url_for('stream_logs')}?log={key}&offset={offset}");
+                source.onmessage = (e) => {{
+                    const atBottom = window.innerHeight + window.scrollY >= document.body.scrollHeight - 40;
+                    log.append(e.data + "\\n");
+                    if (atBottom) window.scrollTo(0, document.body.scrollHeight);
+                }};
+                source.addEventListener("switch", () => location.reload());
+                source.onopen = () => live.textContent = "Live";
+                source.onerror = () => live.textContent = "Reconnecting...";
+            </script>
         </body>
     </html>
     """
 
+@app.route('/logs/stream')
+def stream_logs():
+    """
+    Server-Sent Events: pushes complete lines appended after the client's byte offset
+    (?offset=, or Last-Event-ID on reconnect). Sends a 'switch' event when another log should be shown.
+    """
+    key = request.args.get('log', 'engine')
+    if key not in LOG_FILES: key = 'engine'
+    path = log_path(key)
+    try: offset = int(request.headers.get('Last-Event-ID') or request.args.get('offset', 0))
+    except ValueError: offset = 0
+
+    def events(offset):
+        yield "retry: 2000\n\n"
+        started = time.time()
+        ticks = 0
+        while time.time() - started < LOG_STREAM_SECONDS:
+            try: text, offset = utils.read_log_since(path, offset) if os.path.exists(path) else ("", 0)
+            except OSError: text = ""
+            if text:
+                yield f"id: {offset}\n" + "".join(f"data: {line}\n" for line in text.splitlines()) + "\n"
+            elif ticks % 15 == 0:
+                yield ": keep-alive\n\n"
+            ticks += 1
+            if ticks % 10 == 0 and pick_log() != key:
+                yield f"event: switch\ndata: {pick_log()}\n\n"
+                return
+            time.sleep(1)
+
+    return Response(stream_with_context(events(offset)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 def open_browser():
     try:
         cfg = utils.load_config()
@@ -0,0 +1,207 @@
+"""
+Fake Jellyfin Server (Benchmarks).
+
+Stand-in for the endpoints engine.py and cleaner.py use (Users, Items,
+VirtualFolders, Policy, Media/Updated, single and multi-id Items delete), backed by a
+SyntheticLibrary. Latency and 503s can be injected to exercise retries and
+the adaptive concurrency limit.
+
+    python benchmarks/fake_jellyfin.py --scale large --latency-ms 15 --port 8096
+
+Prints "READY <port>" once listening. GET /__bench/stats returns request
+counts per endpoint; POST /__bench/reset clears them.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticLibrary, LIBRARIES, hex_id
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jellyfin import endpoint_key
+
+class FakeJellyfin:
+    """Server state: virtual folders, user policies and request counters."""
+    def __init__(self, library, latency=0.0, jitter=0.0, write_latency=0.0, error_rate=0.0):
+        self.lib = library
+        self.latency, self.jitter, self.write_latency, self.error_rate = latency, jitter, write_latency, error_rate
+        self.lock = threading.Lock()
+        self.folders = {}
+        for name, (ctype, _, root, _) in LIBRARIES.items():
+            if library.count(name):
+                self.folders[name] = {"Name": name, "ItemId": library.library_ids[name], "CollectionType": ctype, "Locations": [root]}
+        self.policies = {u["Id"]: {"IsAdministrator": False, "EnableAllFolders": True, "EnabledFolders": []} for u in library.users}
+        self.user_index = {u["Id"]: n for n, u in enumerate(library.users)}
+        self._next_folder = 100
+        self.reset()
+
+    def reset(self):
+        with self.lock: self.requests, self.bytes_out = {}, 0
+
+    def stats(self):
+        with self.lock: return {"requests": dict(self.requests), "total": sum(self.requests.values()), "bytes": self.bytes_out}
+
+    def count(self, method, path, nbytes):
+        key = endpoint_key(method, path)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_out += nbytes
+
+    # --- QUERIES ---
+    def source_libs(self, q):
+        """Synthetic libraries selected by ParentIds / IncludeItemTypes."""
+        by_id = {v: k for k, v in self.lib.library_ids.items()}
+        parents = [p for v in q.get("ParentIds", []) for p in v.split(",") if p]
+        libs = [by_id[p] for p in parents if p in by_id] if parents else list(LIBRARIES)
+        types = {t for v in q.get("IncludeItemTypes", []) for t in v.split(",") if t}
+        return [l for l in libs if not types or LIBRARIES[l][1] in types]
+
+    def library_page(self, libs, start, limit):
+        page = []
+        for lib in libs:
+            n = self.lib.count(lib)
+            if start >= n:
+                start -= n
+                continue
+            take = n - start if limit is None else min(n - start, limit - len(page))
+            page += self.lib.items(lib, start, take)
+            start = 0
+            if limit is not None and len(page) >= limit: break
+        return page
+
+    def items(self, q, user_id=None):
+        start = int(q.get("StartIndex", ["0"])[0])
+        limit = int(q["Limit"][0]) if "Limit" in q else None
+        types = {t for v in q.get("IncludeItemTypes", []) for t in v.split(",")}
+        if types & {"CollectionFolder", "UserView"}:
+            term = q.get("SearchTerm", [""])[0].lower()
+            with self.lock: folders = [{"Id": f["ItemId"], "Name": n, "Type": "CollectionFolder"} for n, f in self.folders.items() if term in n.lower()]
+            return {"Items": folders[start:None if limit is None else start + limit], "TotalRecordCount": len(folders)}
+        libs = self.source_libs(q)
+        if user_id is not None and "IsPlayed" in ",".join(q.get("Filters", [])):
+            since = q.get("MinDateLastSavedForUser", [None])[0]
+            if since: since = datetime.strptime(since, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            played = self.lib.played_items(self.user_index[user_id], libs, since)
+            return {"Items": played[start:None if limit is None else start + limit], "TotalRecordCount": len(played)}
+        # The synthetic library never changes: every item was last saved a day before the server started
+        since = q.get("MinDateLastSaved", [None])[0]
+        if since and datetime.strptime(since, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc) > self.lib.now - timedelta(days=1):
+            return {"Items": [], "TotalRecordCount": 0}
+        total = sum(self.lib.count(l) for l in libs)
+        page = self.library_page(libs, start, limit)
+        # Without Fields Jellyfin returns a bare DTO (Id list queries)
+        if "Fields" not in q: page = [{"Id": i["Id"], "Name": i["Name"], "Type": i["Type"]} for i in page]
+        return {"Items": page, "TotalRecordCount": total}
+
+    def user(self, user_id):
+        u = self.lib.users[self.user_index[user_id]]
+        with self.lock: return {**u, "Policy": dict(self.policies[user_id])}
+
+    # --- DISPATCH ---
+    def handle(self, method, path, q, body):
+        """Returns (status, payload)."""
+        parts = [p for p in path.split("/") if p]
+        if path == "/Library/VirtualFolders":
+            name = q.get("name", [""])[0]
+            with self.lock:
+                if method == "GET": return 200, list(self.folders.values())
+                if method == "POST":
+                    if name in self.folders: return 400, {"error": "A library with that name already exists"}
+                    self._next_folder += 1
+                    self.folders[name] = {"Name": name, "ItemId": hex_id(0xB, self._next_folder), "CollectionType": q.get("collectionType", [""])[0],
+                                          "Locations": q.get("paths", []), "LibraryOptions": (body or {}).get("LibraryOptions", {})}
+                    return 204, None
+                if method == "DELETE": return (204, None) if self.folders.pop(name, None) else (404, None)
+        if path in ("/Library/VirtualFolders/LibraryOptions", "/Library/Media/Updated") and method == "POST": return 204, None
+        if path == "/Users" and method == "GET": return 200, [self.user(u["Id"]) for u in self.lib.users]
+        if len(parts) >= 2 and parts[0] == "Users" and parts[1] in self.user_index:
+            if len(parts) == 2 and method == "GET": return 200, self.user(parts[1])
+            if parts[2:] == ["Policy"] and method == "POST":
+                with self.lock: self.policies[parts[1]] = dict(body or {})
+                return 204, None
+            if parts[2:] == ["Items"] and method == "GET": return 200, self.items(q, parts[1])
+        if path == "/Items" and method == "GET": return 200, self.items(q)
+        if parts[:1] == ["Items"] and len(parts) <= 2 and method == "DELETE":
+            ids = set(parts[1:]) or {i for v in q.get("ids", []) for i in v.split(",") if i}
+            with self.lock:
+                for name in [n for n, f in self.folders.items() if f["ItemId"] in ids]: self.folders.pop(name)
+            return 204, None
+        return 404, {"error": f"{method} {path} not implemented by the fake server"}
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args): pass
+
+        def _reply(self, status, payload):
+            data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return len(data)
+
+        def _dispatch(self, method):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if url.path == "/__bench/stats": return self._reply(200, state.stats())
+            if url.path == "/__bench/reset":
+                state.reset()
+                return self._reply(204, None)
+
+            delay = state.latency + random.uniform(0, state.jitter) + (state.write_latency if method != "GET" else 0)
+            if delay: time.sleep(delay)
+            if state.error_rate and random.random() < state.error_rate:
+                state.count(method, url.path, 0)
+                return self._reply(503, {"error": "injected"})
+            try:
+                body = json.loads(raw) if raw else None
+                status, payload = state.handle(method, url.path, parse_qs(url.query), body)
+            except Exception as e: status, payload = 500, {"error": str(e)}
+            state.count(method, url.path, self._reply(status, payload))
+
+        def do_GET(self): self._dispatch("GET")
+        def do_POST(self): self._dispatch("POST")
+        def do_DELETE(self): self._dispatch("DELETE")
+    return Handler
+
+def serve(state, host="127.0.0.1", port=0):
+    """Starts the server on a daemon thread and returns it (server.server_address has the port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-jellyfin", daemon=True).start()
+    return server
+
+def main():
+    p = argparse.ArgumentParser(description="Fake Jellyfin server backed by a synthetic library.")
+    p.add_argument("--scale", default="small", choices=["tiny", "small", "medium", "large"])
+    p.add_argument("--seed", type=int, default=1)
+    for key in ("movies", "series", "albums", "users"): p.add_argument(f"--{key}", type=int, help=f"override the scale's {key} count")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8096, help="0 picks a free port")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="added to every request")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="random extra latency, uniform 0..N")
+    p.add_argument("--write-latency-ms", type=float, default=0.0, help="extra latency for POST/DELETE")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    a = p.parse_args()
+
+    lib = SyntheticLibrary(a.scale, a.seed, movies=a.movies, series=a.series, albums=a.albums, users=a.users)
+    state = FakeJellyfin(lib, a.latency_ms / 1000, a.jitter_ms / 1000, a.write_latency_ms / 1000, a.error_rate)
+    server = serve(state, a.host, a.port)
+    print(f"READY {server.server_address[1]}", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: server.shutdown()
+
+if __name__ == "__main__": main()
@@ -0,0 +1,161 @@
+"""
+Micro-Benchmarks (Scoring & Profile Hot Paths).
+
+Times score_item, profile building (the CPU side of analyze_user_async),
+recency_multiplier, normalize, truncate_path and the batch rankers on fixed
+synthetic fixtures of several sizes, then compares against a stored baseline.
+Scoring runs on both raw Jellyfin dicts and catalog.Item records (what the
+engine scores since the catalog is compacted).
+
+    python benchmarks/micro.py                   # run + compare to baseline.json
+    python benchmarks/micro.py --only score      # substring filter
+    python benchmarks/micro.py --save-baseline   # record this machine's numbers
+
+Exits with status 1 if any benchmark is slower than baseline * (1 + tolerance).
+Baselines are machine specific, so none is shipped (baseline.json is git-ignored):
+record one on your machine before comparing, and re-record it when switching hardware.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Importing engine creates the data directory and resolves DB_PATH and the other data paths
+# from it (config.json, the log dir): point them at a scratch directory, not the real one
+os.environ.setdefault("JELLYDISCOVER_DATA_DIR", tempfile.mkdtemp(prefix="jellydiscover-micro-"))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+import logging
+import engine
+import scoring
+import catalog as catalogs
+from synthetic import SyntheticLibrary
+logging.getLogger().setLevel(logging.WARNING)
+
+SIZES = {"S": 1_000, "M": 10_000, "L": 50_000}
+PLAY_SIZES = {"S": 100, "M": 1_000, "L": 3_000}
+WEIGHTS = engine.CONFIG["SCORING"]["DISCOVERY_BIAS"]["Movies"]
+
+# --------------------------------------------------
+# HARNESS
+# --------------------------------------------------
+def measure(fn, batch=1, repeat=5, min_time=0.1):
+    """Calibrates the loop count so one round takes >= min_time; returns the best round's seconds per call."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops): fn()
+        if time.perf_counter() - t0 >= min_time or loops >= 1 << 20: break
+        loops *= 4
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops): fn()
+        best = min(best, (time.perf_counter() - t0) / loops)
+    return {"per_call_us": round(best / batch * 1e6, 4), "batch": batch,
+            "batch_ms": round(best * 1e3, 4), "per_second": round(batch / best, 1)}
+
+# --------------------------------------------------
+# FIXTURES (fixed seed, built once per size)
+# --------------------------------------------------
+_fixtures = {}
+
+def fixture(size):
+    if size in _fixtures: return _fixtures[size]
+    lib = SyntheticLibrary({"movies": SIZES[size], "series": 0, "albums": 0, "users": 1}, seed=7,
+                           now=datetime.now(timezone.utc))
+    items = lib.items("Movies")
+    rng = random.Random(7)
+    plays = [dict(i, UserData={"Played": True, "LastPlayedDate": f"20{rng.randint(20, 25)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T20:00:00.0000000Z"})
+             for i in rng.sample(items, min(len(items), PLAY_SIZES[size]))]
+    profile = engine.empty_profile()
+    for i in plays: engine.add_play(profile, i)
+    engine.compact_profile(profile)
+    prefs = engine.profile_to_prefs(profile)
+    _fixtures[size] = fx = {"items": items, "records": [catalogs.Item.from_json(i) for i in items], "plays": plays, "prefs": prefs,
+                            "names": [i["Name"] + " (Director's Cut) / Été" for i in items],
+                            "counts": {f"Actor {n}": rng.random() * 50 for n in range(SIZES[size])}}
+    return fx
+
+def build_profile(plays):
+    profile = engine.empty_profile()
+    for i in plays: engine.add_play(profile, i)
+    engine.compact_profile(profile)
+    return engine.profile_to_prefs(profile)
+
+# --------------------------------------------------
+# BENCHMARKS
+# --------------------------------------------------
+def benchmarks(sizes=SIZES):
+    """Yields (name, size, callable, batch); fixtures are only built for the requested sizes."""
+    for size in [s for s in SIZES if s in sizes]:
+        fx = fixture(size)
+        items, prefs, plays = fx["items"], fx["prefs"], fx["plays"]
+        seed = scoring.user_seed("bench", "user")
+        yield "score_item.warm", size, lambda: [engine.score_item(i, prefs, WEIGHTS, False, seed) for i in items], len(items)
+        yield "score_item.cold", size, lambda: [engine.score_item(i, prefs, WEIGHTS, True, seed) for i in items], len(items)
+        ctx = {"played": {i["Id"] for i in plays}, "prefs": prefs, "cold": False, "seed": seed}
+        yield "rank_candidates", size, lambda: engine.rank_candidates(items, ctx, WEIGHTS, 5.0), len(items)
+        records = fx["records"]
+        yield "score_item.record", size, lambda: [engine.score_item(i, prefs, WEIGHTS, False, seed) for i in records], len(records)
+        yield "rank_candidates.record", size, lambda: engine.rank_candidates(records, ctx, WEIGHTS, 5.0), len(records)
+        if scoring.available():
+            matrix = scoring.CategoryMatrix(records)
+            yield "matrix.build", size, lambda: scoring.CategoryMatrix(records), len(records)
+            profiles = [(prefs, False, seed + n) for n in range(16)]
+            yield "matrix.score_16_users", size, lambda: [scoring.top_k(s, 5.0, 25) for _, s in matrix.score_users(profiles, WEIGHTS)], len(records) * 16
+        yield "analyze_user.profile", size, lambda: build_profile(plays), len(plays)
+        yield "recency_multiplier", size, lambda: [engine.recency_multiplier(i) for i in plays], len(plays)
+        yield "normalize", size, lambda: engine.normalize(fx["counts"]), len(fx["counts"])
+        yield "truncate_path", size, lambda: [engine.truncate_path(n) for n in fx["names"]], len(fx["names"])
+
+def load_baseline(path):
+    if not os.path.exists(path): return {}
+    with open(path, "r", encoding="utf-8") as f: return json.load(f).get("results", {})
+
+def main():
+    p = argparse.ArgumentParser(description="Micro-benchmarks for the scoring and profile hot paths.")
+    p.add_argument("--only", help="run benchmarks whose name contains this text")
+    p.add_argument("--sizes", default=",".join(SIZES), help="comma separated subset of " + "/".join(SIZES))
+    p.add_argument("--baseline", default=BASELINE_PATH)
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    a = p.parse_args()
+
+    sizes = set(a.sizes.split(","))
+    baseline = load_baseline(a.baseline)
+    if not baseline and not a.save_baseline: print(f"No baseline at {a.baseline}: record one with --save-baseline to track regressions.\n")
+    results, regressions = {}, []
+    print(f"{'benchmark':<28}{'size':>5}{'us/call':>12}{'calls/s':>14}{'batch ms':>11}{'vs base':>9}")
+    for name, size, fn, batch in benchmarks(sizes):
+        if a.only and a.only not in name: continue
+        key = f"{name}[{size}]"
+        r = results[key] = measure(fn, batch)
+        base = baseline.get(key)
+        ratio = r["per_call_us"] / base["per_call_us"] if base and base["per_call_us"] else None
+        if ratio and ratio > 1 + a.tolerance: regressions.append((key, ratio))
+        shown = f"{ratio:.2f}x" if ratio else "-"
+        print(f"{name:<28}{size:>5}{r['per_call_us']:>12.3f}{r['per_second']:>14,.0f}{r['batch_ms']:>11.2f}{shown:>9}")
+
+    if a.save_baseline:
+        merged = {**baseline, **results}
+        with open(a.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "processor": platform.processor(), "numpy": scoring.available()},
+                       "results": dict(sorted(merged.items()))}, f, indent=2)
+        print(f"\nBaseline saved to {a.baseline}")
+    elif regressions:
+        print("\nREGRESSIONS (slower than baseline by more than the tolerance):")
+        for key, ratio in regressions: print(f"  {key}: {ratio:.2f}x")
+        sys.exit(1)
+
+if __name__ == "__main__": main()
@@ -0,0 +1,137 @@
+"""
+End-to-End Benchmark Runner.
+
+Starts the fake Jellyfin server in a subprocess, points a throwaway data
+directory (JELLYDISCOVER_DATA_DIR) at it and runs engine.run_task() N times,
+optionally followed by the cleaner. Reports wall time, request count, peak
+RSS and files written, per run and per stage.
+
+    python benchmarks/run_benchmark.py --scale medium --runs 2 --latency-ms 10
+    python benchmarks/run_benchmark.py --scale large --stable --json large.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def start_server(args):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_jellyfin.py"), "--port", "0", "--scale", args.scale, "--seed", str(args.seed),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--write-latency-ms", str(args.write_latency_ms), "--error-rate", str(args.error_rate)]
+    for key in ("movies", "series", "albums", "users"):
+        if getattr(args, key) is not None: cmd += [f"--{key}", str(getattr(args, key))]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().split()
+    if line[:1] != ["READY"]:
+        proc.kill()
+        raise RuntimeError("Fake Jellyfin server failed to start")
+    return proc, f"http://127.0.0.1:{line[1]}"
+
+def server_call(url, path, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url + path, method=method)) as r:
+        data = r.read()
+    return json.loads(data) if data else None
+
+def prepare_data_dir(path, url, args):
+    """Writes config.json / libraries.json before engine (and utils) are imported."""
+    os.environ["JELLYDISCOVER_DATA_DIR"] = path
+    sys.path.insert(0, REPO_DIR)
+    import utils
+    config = utils.load_config()
+    config.update({"JELLYFIN_URL": url, "API_KEY": "benchmark", "MAX_THREADS": args.threads, "STABLE_LIBRARIES": args.stable})
+    utils.save_config(config)
+    with open(utils.LIBRARIES_PATH, "w", encoding="utf-8") as f:
+        json.dump({"CATEGORIES": {
+            "Movies": {"enabled": True, "discovery_name": "Discover Movies", "min_community_score": 5.0},
+            "Shows": {"enabled": True, "discovery_name": "Discover Shows", "min_community_score": 5.0},
+            "Music": {"enabled": True, "discovery_name": "Discover Music", "min_community_score": 0.0}}}, f)
+
+def run_once(label, fn, url):
+    server_call(url, "/__bench/reset", "POST")
+    started = time.perf_counter()
+    try: fn()
+    except SystemExit as e: print(f"[!] {label} exited early ({e.code}); see the log in the data directory")
+    wall = time.perf_counter() - started
+    stats = server_call(url, "/__bench/stats")
+    return {"label": label, "wall_seconds": round(wall, 3), "requests": stats["total"], "response_bytes": stats["bytes"],
+            "peak_rss_mb": peak_rss_mb(), "by_endpoint": stats["requests"]}
+
+def report(result, metrics):
+    print(f"\n=== {result['label']}: {result['wall_seconds']}s, {result['requests']} requests, "
+          f"{result['response_bytes'] / 1e6:.1f} MB received, peak RSS {result['peak_rss_mb']} MB")
+    counters = metrics.get("counters", {})
+    print(f"    files written {counters.get('files_written', 0)}, bytes copied {counters.get('bytes_copied', 0)}, "
+          f"folders +{counters.get('folders_written', 0)}/-{counters.get('folders_removed', 0)}, users {counters.get('users_processed', 0)} (+{counters.get('users_skipped', 0)} reused)")
+    print(f"    {'stage':<16}{'seconds':>10}{'requests':>10}{'files':>10}{'peak RSS':>10}")
+    for stage, sec in metrics.get("stages", {}).items():
+        rss = metrics.get("stage_peak_rss_mb", {}).get(stage)
+        print(f"    {stage:<16}{sec:>10.3f}{metrics.get('stage_requests', {}).get(stage, 0):>10}"
+              f"{metrics.get('stage_files', {}).get(stage, 0):>10}{'-' if rss is None else rss:>10}")
+    print("    (worker stages overlap, so their request and file counts include other threads' work;")
+    print("     peak RSS is the process high-water mark when the stage ended)")
+    print(f"    {'endpoint':<44}{'requests':>10}")
+    for key, n in sorted(result["by_endpoint"].items(), key=lambda kv: -kv[1]):
+        print(f"    {key:<44}{n:>10}")
+
+def main():
+    p = argparse.ArgumentParser(description="End-to-end JellyDiscover benchmark against a fake Jellyfin.")
+    p.add_argument("--scale", default="small", choices=["tiny", "small", "medium", "large"])
+    p.add_argument("--seed", type=int, default=1)
+    for key in ("movies", "series", "albums", "users"): p.add_argument(f"--{key}", type=int)
+    p.add_argument("--runs", type=int, default=2, help="engine runs (the first is cold, later ones incremental)")
+    p.add_argument("--threads", type=int, default=4, help="MAX_THREADS for the engine")
+    p.add_argument("--stable", action="store_true", help="STABLE_LIBRARIES mode")
+    p.add_argument("--cleaner", action="store_true", help="run the cleaner after the engine")
+    p.add_argument("--latency-ms", type=float, default=2.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--write-latency-ms", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--data-dir", help="keep state here instead of a temporary directory")
+    p.add_argument("--json", help="write results to this file")
+    a = p.parse_args()
+
+    data_dir = a.data_dir or tempfile.mkdtemp(prefix="jellydiscover-bench-")
+    proc, url = start_server(a)
+    results = []
+    try:
+        prepare_data_dir(data_dir, url, a)
+        import engine
+        engine.setup_logging()
+        for n in range(a.runs):
+            result = run_once(f"engine run {n + 1}", engine.run_task, url)
+            result["metrics"] = engine.METRICS.to_dict()
+            report(result, result["metrics"])
+            results.append(result)
+        if a.cleaner:
+            import cleaner
+            result = run_once("cleaner", cleaner.main, url)
+            result["metrics"] = cleaner.METRICS.to_dict()
+            report(result, result["metrics"])
+            results.append(result)
+    finally:
+        proc.terminate()
+        if not a.data_dir: shutil.rmtree(data_dir, ignore_errors=True)
+
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump({"scale": a.scale, "args": vars(a), "results": results}, f, indent=2)
+
+if __name__ == "__main__": main()
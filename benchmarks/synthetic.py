@@ -0,0 +1,115 @@
+"""
+Synthetic Jellyfin Library (Benchmarks).
+
+Deterministic generator for movies, series, music albums and users with play
+histories. Items are derived from (seed, library, index) on demand, so a
+155k-item library costs no memory until a page is requested; only each
+user's play list is cached once it has been generated.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+SCALES = {
+    "tiny":   {"movies": 500,     "series": 50,    "albums": 200,    "users": 5},
+    "small":  {"movies": 5_000,   "series": 300,   "albums": 2_000,  "users": 25},
+    "medium": {"movies": 25_000,  "series": 1_500, "albums": 12_000, "users": 100},
+    "large":  {"movies": 100_000, "series": 5_000, "albums": 50_000, "users": 500},
+}
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family",
+          "Fantasy", "History", "Horror", "Music", "Mystery", "Romance", "Science Fiction", "Thriller",
+          "War", "Western", "Rock", "Pop", "Jazz", "Electronic", "Classical", "Hip-Hop"]
+ACTOR_POOL = 6_000
+DIRECTOR_POOL = 900
+ARTIST_POOL = 4_000
+
+# name -> (Jellyfin CollectionType, item Type, media root, Id prefix)
+LIBRARIES = {
+    "Movies": ("movies",  "Movie",      "/media/movies", 0x1),
+    "Shows":  ("tvshows", "Series",     "/media/tv",     0x2),
+    "Music":  ("music",   "MusicAlbum", "/media/music",  0x3),
+}
+SIZE_KEYS = {"Movies": "movies", "Shows": "series", "Music": "albums"}
+
+def hex_id(prefix, n):
+    """32-char hex Id (same shape as Jellyfin's, so endpoint keys collapse the same way)."""
+    return f"{(prefix << 124) | n:032x}"
+
+def skewed(rng, pool):
+    """Popularity-skewed pick: low indices (popular people/artists) come up far more often."""
+    return int(pool * rng.random() ** 2.5)
+
+class SyntheticLibrary:
+    def __init__(self, scale="small", seed=1, now=None, **overrides):
+        sizes = dict(SCALES[scale]) if isinstance(scale, str) else dict(scale)
+        sizes.update({k: v for k, v in overrides.items() if v is not None})
+        self.sizes = sizes
+        self.seed = seed
+        self.now = now or datetime.now(timezone.utc)
+        self.library_ids = {name: hex_id(0xA, n + 1) for n, name in enumerate(LIBRARIES)}
+        self.users = [{"Id": hex_id(0xF, u + 1), "Name": f"User{u:04d}"} for u in range(sizes["users"])]
+        self._plays = {}
+
+    def count(self, lib):
+        return self.sizes[SIZE_KEYS[lib]]
+
+    def _rng(self, *key):
+        # String seeds are hashed with SHA-512, so this is stable across processes (unlike hash())
+        return random.Random(":".join(map(str, (self.seed,) + key)))
+
+    def item(self, lib, i, user_data=None):
+        """Full item dict as returned with Fields=Path,CommunityRating,Genres,People,CollectionName,..."""
+        collection_type, item_type, root, prefix = LIBRARIES[lib]
+        rng = self._rng(lib, i)
+        year = 1950 + int(75 * rng.random() ** 0.5)
+        # Primary genre is i % len(GENRES) so play histories can be biased cheaply (see plays())
+        genres = [GENRES[i % len(GENRES)]] + rng.sample(GENRES, rng.randint(0, 2))
+        item = {"Id": hex_id(prefix, i + 1), "Type": item_type, "ProductionYear": year,
+                "Genres": list(dict.fromkeys(genres))}
+        if lib == "Music":
+            artist = f"Artist {skewed(rng, ARTIST_POOL)}"
+            item.update({"Name": f"Album {i}", "AlbumArtist": artist, "Artists": [artist],
+                         "Path": f"{root}/{artist}/Album {i} ({year})", "People": []})
+            if rng.random() < 0.3: item["CommunityRating"] = round(rng.uniform(5, 9.5), 1)
+        else:
+            name = f"{'Movie' if lib == 'Movies' else 'Series'} {i}"
+            item.update({"Name": name, "Path": f"{root}/{name} ({year})",
+                         "CommunityRating": round(min(10.0, max(1.0, rng.gauss(6.6, 1.1))), 1),
+                         "People": [{"Name": f"Director {skewed(rng, DIRECTOR_POOL)}", "Type": "Director"}] +
+                                   [{"Name": f"Actor {skewed(rng, ACTOR_POOL)}", "Type": "Actor"} for _ in range(rng.randint(3, 8))]})
+            if lib == "Movies" and i % 10 < 2: item["CollectionName"] = f"Collection {i // 10}"
+        if user_data is not None: item["UserData"] = user_data
+        return item
+
+    def items(self, lib, start=0, limit=None):
+        stop = self.count(lib) if limit is None else min(self.count(lib), start + limit)
+        return [self.item(lib, i) for i in range(start, stop)]
+
+    def plays(self, user_index):
+        """[(lib, index, last_played)] for one user: a few favourite genres, recent-heavy dates."""
+        cached = self._plays.get(user_index)
+        if cached is not None: return cached
+        rng = self._rng("user", user_index)
+        favourites = rng.sample(range(len(GENRES)), 3)
+        n_plays = min(3_000, int(rng.lognormvariate(5.0, 0.9)))
+        plays = {}
+        for _ in range(n_plays):
+            lib = rng.choices(list(LIBRARIES), weights=(6, 3, 2))[0]
+            n = self.count(lib)
+            if n == 0: continue
+            g = rng.choice(favourites) if rng.random() < 0.7 else rng.randrange(len(GENRES))
+            slots = max(1, (n - g + len(GENRES) - 1) // len(GENRES))
+            idx = min(n - 1, g + len(GENRES) * int(slots * rng.random() ** 1.5))
+            plays[(lib, idx)] = self.now - timedelta(days=1095 * rng.random() ** 2, seconds=rng.randrange(86400))
+        self._plays[user_index] = cached = [(lib, idx, when) for (lib, idx), when in plays.items()]
+        return cached
+
+    def played_items(self, user_index, libs=None, since=None):
+        """Played items with UserData, optionally limited to some libraries / LastPlayedDate >= since."""
+        out = []
+        for lib, idx, when in self.plays(user_index):
+            if libs is not None and lib not in libs: continue
+            if since is not None and when < since: continue
+            stamp = when.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+            out.append(self.item(lib, idx, {"Played": True, "PlayCount": 1, "LastPlayedDate": stamp}))
+        return out
@@ -0,0 +1,109 @@
+"""
+Compact Candidate Catalog.
+
+Catalog items are kept as __slots__ records holding only what the scorer and
+the materializer read (Id, Name, Path, Type, rating, genres, directors,
+actors, collection, artist) instead of raw Jellyfin JSON. Genre, person and
+collection names are interned ONCE per process as small integers, so a name
+shared by 10k items costs one string plus 10k references.
+
+Records still answer the handful of Jellyfin keys the rest of the code reads
+(item["Id"], item.get("Genres"), ...), so score_item, add_play and the
+materializer work on both raw dicts and records.
+
+Like scoring.py, this module has no side effects on import.
+"""
+import sys
+
+# --------------------------------------------------
+# STRING INTERNING
+# --------------------------------------------------
+class Interner:
+    """Bidirectional name <-> small int table."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.groups = {}
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return i
+
+    def group(self, names):
+        """Interned tuple of ids: items with the same genre list share one tuple."""
+        key = tuple(self.id(n) for n in names)
+        return self.groups.setdefault(key, key)
+
+    def name(self, i):
+        return self.names[i]
+
+    def __len__(self):
+        return len(self.names)
+
+# One table for every catalog in the process: ids stay valid across runs in daemon mode
+NAMES = Interner()
+
+# --------------------------------------------------
+# RECORDS
+# --------------------------------------------------
+class Item:
+    __slots__ = ("Id", "Name", "Path", "Type", "rating", "genres", "directors", "actors", "collection", "artist")
+
+    def __init__(self, id, name, path, type, rating=0.0, genres=(), directors=(), actors=(), collection=-1, artist=-1):
+        self.Id, self.Name, self.Path, self.Type = id, name, path, type
+        self.rating, self.genres, self.directors, self.actors = rating, genres, directors, actors
+        self.collection, self.artist = collection, artist
+
+    @classmethod
+    def from_json(cls, raw):
+        """Keeps the scored/materialized fields of a Jellyfin item; People are reduced to Directors and Actors."""
+        people = raw.get("People") or []
+        artist = raw.get("AlbumArtist") or (raw.get("Artists") or [None])[0]
+        return cls(raw["Id"], raw.get("Name") or "", raw.get("Path"), sys.intern(raw.get("Type") or ""),
+                   float(raw.get("CommunityRating") or 0.0),
+                   NAMES.group(raw.get("Genres") or ()),
+                   tuple(NAMES.id(p["Name"]) for p in people if p.get("Type") == "Director"),
+                   tuple(NAMES.id(p["Name"]) for p in people if p.get("Type") == "Actor"),
+                   NAMES.id(raw["CollectionName"]) if raw.get("CollectionName") else -1,
+                   NAMES.id(artist) if artist else -1)
+
+    def features(self):
+        """(kind, name) pairs in the order scoring.item_features walks a raw item."""
+        for g in self.genres: yield "genres", NAMES.names[g]
+        for d in self.directors: yield "directors", NAMES.names[d]
+        for a in self.actors: yield "actors", NAMES.names[a]
+
+    def to_json(self):
+        """Jellyfin-shaped dict (only the kept fields)."""
+        out = {"Id": self.Id, "Name": self.Name, "Path": self.Path, "Type": self.Type}
+        if self.rating: out["CommunityRating"] = self.rating
+        out["Genres"] = [NAMES.names[g] for g in self.genres]
+        out["People"] = self.get("People")
+        if self.collection >= 0: out["CollectionName"] = NAMES.names[self.collection]
+        if self.artist >= 0: out["AlbumArtist"] = NAMES.names[self.artist]
+        return out
+
+    # --- Read-only Jellyfin-style access ---
+    def get(self, key, default=None):
+        if key in ("Id", "Name", "Path", "Type"): return getattr(self, key)
+        if key == "CommunityRating": return self.rating if self.rating else default
+        if key == "Genres": return [NAMES.names[g] for g in self.genres]
+        if key == "People":
+            return ([{"Name": NAMES.names[d], "Type": "Director"} for d in self.directors] +
+                    [{"Name": NAMES.names[a], "Type": "Actor"} for a in self.actors])
+        if key == "CollectionName": return NAMES.names[self.collection] if self.collection >= 0 else default
+        if key == "AlbumArtist": return NAMES.names[self.artist] if self.artist >= 0 else default
+        if key == "Artists": return [NAMES.names[self.artist]] if self.artist >= 0 else default
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError: raise KeyError(key)
+        return value
+
+    def __repr__(self):
+        return f"Item({self.Id!r}, {self.Name!r})"
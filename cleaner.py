@@ -1,19 +1,17 @@
 import os
 import sys
 import shutil
-import requests
 import time
+import asyncio
 import logging
 import socket
-import concurrent.futures
 import subprocess
 import platform
 from logging.handlers import RotatingFileHandler
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 # Import Shared Brain
 import utils
+import jellyfin
 
 # --- CONFIG & LOGGING ---
 LOG_FILE = os.path.join(utils.LOG_DIR, "cleaner.log")
@@ -36,11 +34,6 @@ CONFIG = utils.load_config()
 # TIMEOUT: 300s (5 Minutes) to handle massive database locks
 TIMEOUT = 300 
 
-HEADERS = {
-    "X-Emby-Token": CONFIG.get("API_KEY", ""),
-    "Content-Type": "application/json"
-}
-
 # --- NOTIFICATION SYSTEM (OS AGNOSTIC) ---
 def send_notification(title, message):
     """
@@ -76,16 +69,34 @@ def send_notification(title, message):
     except Exception as e:
         logging.warning(f"Notification failed: {e}")
 
-# --- SESSION SETUP (With Retries) ---
-def get_session():
-    """Creates a session with retry logic for connection stability."""
-    s = requests.Session()
-    retries = Retry(total=3, backoff_factor=2, status_forcelist=[500, 502, 503, 504])
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    s.headers.update(HEADERS)
-    return s
-
-session = get_session()
+# --- CLIENT SETUP (With Retries) ---
+def get_client():
+    """Async client with retry logic; destructive endpoints are capped at MAX_THREADS in flight."""
+    threads = CONFIG.get("MAX_THREADS", 2)
+    limits = {
+        "DELETE /Library/VirtualFolders": threads,
+        "DELETE /Items/{id}": threads,
+        "DELETE /Items": threads,
+        "POST /Users/{id}/Policy": threads,
+        **CONFIG.get("HTTP_ENDPOINT_LIMITS", {})
+    }
+    return jellyfin.JellyfinClient(CONFIG.get("JELLYFIN_URL", ""), CONFIG.get("API_KEY", ""), timeout=TIMEOUT,
+                                   max_connections=CONFIG.get("HTTP_MAX_CONNECTIONS", 32), endpoint_limits=limits,
+                                   retries=3, backoff=2, retry_statuses=[500, 502, 503, 504],
+                                   adaptive=CONFIG.get("HTTP_ADAPTIVE", True), initial_concurrency=threads,
+                                   target_latency=CONFIG.get("HTTP_TARGET_LATENCY", 2.0))
+
+api = get_client()
+KEYWORDS = ["Discover Movies", "Discover Shows", "Discover Music", "Recommended"]
+DELETE_BATCH = 50  # Ids per DELETE /Items?ids= request (keeps the URL well under 2 KB)
+BATCH_DELETE = {"supported": True}  # Cleared if the server rejects the multi-id form (405)
+METRICS = utils.RunMetrics("cleaner")
+api.observer = METRICS.record_http
+
+def log_http_stats(label):
+    s = api.stats()
+    logging.info(f"      [HTTP] {label}: concurrency {s['concurrency']}, {s['requests']} requests, "
+                 f"p50 {s['p50']}s p95 {s['p95']}s p99 {s['p99']}s, {s['throttled']} throttled, {s['errors']} errors")
 
 # --- LOCKING MECHANISM ---
 _lock_socket = None
@@ -101,53 +112,81 @@ def acquire_lock():
         return False
 
 # ==========================================
-# WORKER FUNCTIONS (For Threading)
+# WORKER COROUTINES (Run concurrently on the async client)
 # ==========================================
 
-def delete_library_worker(name):
+async def delete_library_worker(name):
     """Worker: Deletes a single Library Config."""
     try:
         # refreshLibrary=true triggers a DB event on the server
-        url = f"{CONFIG.get('JELLYFIN_URL')}/Library/VirtualFolders?name={name}&refreshLibrary=true"
         logging.info(f"      [BUSY] Deleting Config: '{name}'")
         
         # DELETE Request
-        res = session.delete(url, timeout=TIMEOUT)
+        res = await api.adelete("/Library/VirtualFolders", params={"name": name, "refreshLibrary": "true"})
         
         if res.status_code in [200, 204]:
             logging.info(f"      [DONE] Deleted Config: '{name}'")
+            METRICS.add("libraries_deleted")
         else:
             logging.warning(f"      [FAIL] Could not delete '{name}': {res.status_code}")
 
-    except requests.exceptions.ReadTimeout:
+    except jellyfin.RequestTimeout:
         logging.error(f"      [TIMEOUT] Server took too long to delete '{name}'. It might still be processing in the background.")
     except Exception as e:
         logging.error(f"      [ERR] Error deleting '{name}': {e}")
 
-def delete_item_worker(item_data):
+async def delete_item_worker(item_data):
     """Worker: Deletes a single Database Item."""
     name, item_id = item_data
     try:
-        url = f"{CONFIG.get('JELLYFIN_URL')}/Items/{item_id}"
         logging.info(f"      [BUSY] Nuking DB Item: '{name}'")
         
         # DELETE Request
-        res = session.delete(url, timeout=TIMEOUT)
+        res = await api.adelete(f"/Items/{item_id}")
         
         if res.status_code in [200, 204]:
             logging.info(f"      [DONE] Nuked Item: '{name}'")
+            METRICS.add("items_deleted")
+        elif res.status_code == 404:
+            logging.info(f"      [GONE] Already removed: '{name}'")
         else:
             logging.warning(f"      [FAIL] Could not nuke '{name}': {res.status_code}")
 
-    except requests.exceptions.ReadTimeout:
+    except jellyfin.RequestTimeout:
         logging.error(f"      [TIMEOUT] Server took too long to nuke '{name}'. Skipping to prevent lock-up.")
     except Exception as e:
         logging.error(f"      [ERR] Error nuking '{name}': {e}")
 
-def prune_policy_worker(user, real_ids):
+async def delete_batch_worker(batch):
+    """
+    Worker: Deletes a batch of (name, id) with one DELETE /Items?ids= request.
+    A failed batch is split in half and retried, so only the ids that really fail end up as per-item deletes.
+    """
+    if len(batch) == 1 or not BATCH_DELETE["supported"]:
+        await asyncio.gather(*(delete_item_worker(item) for item in batch))
+        return
+    try:
+        res = await api.adelete("/Items", params={"ids": ",".join(item_id for _, item_id in batch)})
+        if res.status_code in [200, 204]:
+            logging.info(f"      [DONE] Nuked {len(batch)} items in one request")
+            METRICS.add("items_deleted", len(batch))
+            return
+        if res.status_code == 405:
+            BATCH_DELETE["supported"] = False
+            logging.warning("      [WARN] Server does not support batch deletes. Falling back to one request per item.")
+        else:
+            logging.warning(f"      [FAIL] Batch of {len(batch)} rejected ({res.status_code}). Splitting...")
+    except jellyfin.RequestTimeout:
+        logging.warning(f"      [TIMEOUT] Batch of {len(batch)} timed out. Splitting...")
+    except Exception as e:
+        logging.warning(f"      [ERR] Batch of {len(batch)} failed ({e}). Splitting...")
+    mid = len(batch) // 2
+    await asyncio.gather(delete_batch_worker(batch[:mid]), delete_batch_worker(batch[mid:]))
+
+async def prune_policy_worker(user, real_ids):
     """Worker: Syncs a single user's policy."""
     try:
-        u_res = session.get(f"{CONFIG.get('JELLYFIN_URL')}/Users/{user['Id']}", timeout=TIMEOUT)
+        u_res = await api.aget(f"/Users/{user['Id']}")
         if u_res.status_code != 200: return
         
         full_user = u_res.json()
@@ -160,9 +199,9 @@ def prune_policy_worker(user, real_ids):
         if len(clean_folders) < len(enabled_folders):
             diff = len(enabled_folders) - len(clean_folders)
             policy["EnabledFolders"] = clean_folders
-            session.post(f"{CONFIG.get('JELLYFIN_URL')}/Users/{user['Id']}/Policy", 
-                         json=policy, timeout=TIMEOUT)
+            await api.apost(f"/Users/{user['Id']}/Policy", json=policy)
             logging.info(f"      [DONE] Cleaned {diff} ghosts for user: {user['Name']}")
+            METRICS.add("policies_pruned")
     except Exception as e:
         logging.error(f"      [ERR] Error pruning user {user.get('Name')}: {e}")
 
@@ -176,12 +215,11 @@ def remove_active_libraries():
     if not CONFIG.get("JELLYFIN_URL") or not CONFIG.get("API_KEY"): return
 
     try:
-        res = session.get(f"{CONFIG.get('JELLYFIN_URL')}/Library/VirtualFolders", timeout=TIMEOUT)
+        res = api.get("/Library/VirtualFolders")
         if res.status_code != 200: return
 
         libraries = res.json()
         to_delete = []
-        KEYWORDS = ["Discover Movies", "Discover Shows", "Discover Music", "Recommended"]
         
         for lib in libraries:
             name = lib.get("Name", "")
@@ -193,10 +231,9 @@ def remove_active_libraries():
             return
 
         thread_count = CONFIG.get("MAX_THREADS", 2)
-        logging.info(f"      - Found {len(to_delete)} configs. Deleting with {thread_count} threads...")
+        logging.info(f"      - Found {len(to_delete)} configs. Deleting {thread_count} at a time...")
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-            executor.map(delete_library_worker, to_delete)
+        api.gather([delete_library_worker(name) for name in to_delete])
 
     except Exception as e:
         logging.error(f"[!] Stage 1 Failed: {e}")
@@ -205,29 +242,23 @@ def remove_database_garbage():
     """Stage 2: Concurrent deletion of Orphaned Database Items."""
     logging.info("[2/4] Scanning Database for Garbage Items...")
     try:
-        url = f"{CONFIG.get('JELLYFIN_URL')}/Items?Recursive=true&IncludeItemTypes=CollectionFolder,UserView&Fields=Id,Name"
-        res = session.get(url, timeout=TIMEOUT)
-        if res.status_code != 200: return
-        
-        items = res.json().get('Items', [])
-        KEYWORDS = ["Discover Movies", "Discover Shows", "Discover Music", "Recommended"]
-        
-        to_nuke = []
-        for item in items:
-            name = item.get("Name", "")
-            item_id = item.get("Id")
-            if any(k in name for k in KEYWORDS):
-                to_nuke.append((name, item_id))
+        # Paged and filtered on the server (one SearchTerm per keyword); names are re-checked here
+        params = {"Recursive": "true", "IncludeItemTypes": "CollectionFolder,UserView", "EnableImages": "false", "EnableUserData": "false"}
+        found = {}
+        for keyword in KEYWORDS:
+            for item in api.iter_items("/Items", {**params, "SearchTerm": keyword}, CONFIG.get("PAGE_SIZE", 500)):
+                name = item.get("Name", "")
+                if any(k in name for k in KEYWORDS): found[item.get("Id")] = name
+        to_nuke = [(name, item_id) for item_id, name in found.items()]
         
         if not to_nuke: 
             logging.info("      - No garbage items found.")
             return
 
         thread_count = CONFIG.get("MAX_THREADS", 2)
-        logging.info(f"      - Found {len(to_nuke)} garbage items. Nuking with {thread_count} threads...")
+        logging.info(f"      - Found {len(to_nuke)} garbage items. Nuking in batches of {DELETE_BATCH}, {thread_count} at a time...")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-            executor.map(delete_item_worker, to_nuke)
+        api.gather([delete_batch_worker(to_nuke[i:i + DELETE_BATCH]) for i in range(0, len(to_nuke), DELETE_BATCH)])
             
     except Exception as e:
         logging.error(f"[!] Stage 2 Failed: {e}")
@@ -261,7 +292,7 @@ def prune_ghost_policies():
     
     real_ids = []
     try:
-        res = session.get(f"{CONFIG.get('JELLYFIN_URL')}/Library/VirtualFolders", timeout=TIMEOUT)
+        res = api.get("/Library/VirtualFolders")
         if res.status_code == 200:
             real_ids = [lib.get("ItemId") for lib in res.json()]
     except:
@@ -269,12 +300,8 @@ def prune_ghost_policies():
         return
 
     try:
-        users = session.get(f"{CONFIG.get('JELLYFIN_URL')}/Users", timeout=TIMEOUT).json()
-        thread_count = CONFIG.get("MAX_THREADS", 2)
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-            futures = [executor.submit(prune_policy_worker, user, real_ids) for user in users]
-            concurrent.futures.wait(futures)
+        users = api.get("/Users").json()
+        api.gather([prune_policy_worker(user, real_ids) for user in users])
                 
     except Exception as e:
         logging.error(f"[!] Stage 4 Failed: {e}")
@@ -283,20 +310,35 @@ def main():
     if not acquire_lock():
         logging.error("CRITICAL: Cannot start Cleaner. Engine is running.")
         sys.exit(1)
-
-    # NOTIFY START
-    send_notification("JellyDiscover", "Cleanup Utility Started")
-    
-    logging.info(">>> STARTING CONCURRENT OMNIBUS CLEANER (TIMEOUT: 300s)")
-    
-    remove_active_libraries()    # 1. Configs
-    remove_database_garbage()    # 2. Database Items
-    clean_local_files()          # 3. Disk
-    prune_ghost_policies()       # 4. User Profiles
-    
-    # NOTIFY END
-    send_notification("JellyDiscover", "Cleanup Complete")
-    logging.info(">>> CLEANUP COMPLETE")
+    heartbeat = utils.Heartbeat("cleaner").start()
+    heartbeat.reset_progress(job="clean")
+    heartbeat.update("running")
+    def stage(name):
+        heartbeat.stage(name, unit="steps")
+        return METRICS.stage(name)
+    try:
+        # NOTIFY START
+        send_notification("JellyDiscover", "Cleanup Utility Started")
+        
+        logging.info(">>> STARTING CONCURRENT OMNIBUS CLEANER (TIMEOUT: 300s)")
+        
+        with stage("configs"): remove_active_libraries()        # 1. Configs
+        log_http_stats("configs")
+        with stage("database_items"): remove_database_garbage() # 2. Database Items
+        log_http_stats("database items")
+        with stage("disk"): clean_local_files()                 # 3. Disk
+        with stage("policies"): prune_ghost_policies()          # 4. User Profiles
+        log_http_stats("policies")
+        
+        # Saved after the disk stage on purpose: it recreates jelly_data.db with only this run's metrics
+        METRICS.set_controller(api.stats())
+        try: METRICS.save()
+        except Exception as e: logging.warning(f"[!] Could not save run metrics: {e}")
+        
+        # NOTIFY END
+        send_notification("JellyDiscover", "Cleanup Complete")
+        logging.info(">>> CLEANUP COMPLETE")
+    finally: heartbeat.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
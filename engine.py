@@ -1,43 +1,54 @@
-print(">>> JellyDiscover Starting")
 import os
 import sys
 import json
-import requests
+import hashlib
 import sqlite3
 import time
 import random
+import heapq
 import shutil
+import tempfile
+import stat
+import threading
 import subprocess
 import socket
 import ctypes
+import contextlib
 import concurrent.futures
+import asyncio
 import logging
 import platform
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 import utils 
+import scoring
+import catalog as catalogs
+import jellyfin
+
+# Process setup (console, elevation, log file) runs from main(), not on import: scoring
+# workers are spawned on Windows and re-import this file as __mp_main__.
 
 # --- FORCE UTF-8 ---
-if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
-    try:
-        if sys.stdout: sys.stdout.reconfigure(encoding='utf-8')
-    except Exception: pass
+def force_utf8():
+    if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
+        try:
+            if sys.stdout: sys.stdout.reconfigure(encoding='utf-8')
+        except Exception: pass
 
 # --- AUTO-ELEVATION ---
 def is_admin():
     try: return ctypes.windll.shell32.IsUserAnAdmin()
     except: return False
 
-if not is_admin() and sys.platform == "win32":
-    if len(sys.argv) == 1:
-        try:
-            print("[!] Requesting elevation for Drive Snapshot & Symlink Test...", flush=True)
-            ctypes.windll.shell32.ShellExecuteW(None, "runas", sys.executable, " ".join(sys.argv), None, 1)
-            sys.exit()
-        except Exception: pass 
+def elevate():
+    if not is_admin() and sys.platform == "win32":
+        if len(sys.argv) == 1:
+            try:
+                print("[!] Requesting elevation for Drive Snapshot & Symlink Test...", flush=True)
+                ctypes.windll.shell32.ShellExecuteW(None, "runas", sys.executable, " ".join(sys.argv), None, 1)
+                sys.exit()
+            except Exception: pass 
 
 # --------------------------------------------------
 # CONFIGURATION & FATAL ERROR HANDLING
@@ -46,11 +57,13 @@ DATA_ROOT = utils.DATA_DIR
 LOG_FILE = os.path.join(utils.LOG_DIR, "JellyDiscover.log")
 DB_FILE = utils.DATA_DIR # Fixed: utils defines DB_FILE logic or we construct it
 if not os.path.exists(utils.DATA_DIR): os.makedirs(utils.DATA_DIR, exist_ok=True)
-DB_PATH = os.path.join(utils.DATA_DIR, "jelly_data.db")
+DB_PATH = utils.DB_PATH
 
 # Load Config via Utils
 CONFIG = utils.load_config()
 LIBS = utils.load_libraries()
+METRICS = utils.RunMetrics("engine")  # Replaced at the start of every run
+HEARTBEAT = None  # utils.Heartbeat, started by main() (not when imported by benchmarks)
 
 UI_MAP = {
     "Movies": {"api_type": "movies", "item_type": "Movie"},
@@ -68,6 +81,25 @@ def fatal(msg):
     except: pass
     sys.exit(1)
 
+# --------------------------------------------------
+# HEARTBEAT & PROGRESS (Read by the dashboard)
+# --------------------------------------------------
+def heartbeat(state=None, **progress):
+    if HEARTBEAT: HEARTBEAT.update(state, **progress)
+
+def start_job(name):
+    if HEARTBEAT: HEARTBEAT.reset_progress(job=name)
+    heartbeat("running")
+
+def progress_advance(n=1):
+    if HEARTBEAT: HEARTBEAT.advance(n)
+
+@contextlib.contextmanager
+def run_stage(name, total=None, unit="users"):
+    """A top-level run stage: timed in METRICS and published as progress (units done, rate, ETA)."""
+    if HEARTBEAT: HEARTBEAT.stage(name, total, unit)
+    with METRICS.stage(name): yield
+
 # --------------------------------------------------
 # LOCKING & LOGGING
 # --------------------------------------------------
@@ -116,13 +148,14 @@ def send_notification(title, message):
 
 from logging.handlers import RotatingFileHandler
 
-log_handlers = [logging.StreamHandler(sys.stdout)]
-try:
-    # Rotate logs: Max 5MB, keep 3 backups
-    rfh = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=3, encoding='utf-8')
-    log_handlers.append(rfh)
-except: pass
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", handlers=log_handlers)
+def setup_logging():
+    log_handlers = [logging.StreamHandler(sys.stdout)]
+    try:
+        # Rotate logs: Max 5MB, keep 3 backups
+        rfh = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=3, encoding='utf-8')
+        log_handlers.append(rfh)
+    except: pass
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", handlers=log_handlers)
 
 # --------------------------------------------------
 # UTILS & NETWORK
@@ -151,7 +184,8 @@ def startup_local_cleanup():
     if os.path.exists(marker): return
     logging.info("[*] First run detected. Performing local cleanup...")
     for item in os.listdir(DATA_ROOT):
-        if item in ("JellyDiscover.log", "jelly_data.db", ".installed", "drive_map.json", "logs", "config.json", "libraries.json", "status.json"): continue
+        if item in ("JellyDiscover.log", "jelly_data.db", ".installed", "drive_map.json", "logs", "config.json", "libraries.json", "status.json", "log_index.json"): continue
+        if item.startswith("heartbeat_") and item.endswith(".json"): continue  # Written by a running engine/cleaner
         full_path = os.path.join(DATA_ROOT, item)
         if not is_safe_path(full_path): continue
         safe_delete(full_path)
@@ -159,17 +193,36 @@ def startup_local_cleanup():
         with open(marker, "w") as f: f.write(datetime.now(timezone.utc).isoformat())
     except: pass
 
-session = requests.Session()
-retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
-adapter = HTTPAdapter(max_retries=retry)
-session.mount("http://", adapter)
-session.mount("https://", adapter)
-session.headers.update({"X-Emby-Token": CONFIG.get("API_KEY", ""), "Content-Type": "application/json"})
 TIMEOUT = 60
+# All HTTP goes through one async client: bounded per host and per endpoint, retries 429/5xx.
+# In-flight concurrency starts at MAX_THREADS and adapts (AIMD) between 1 and HTTP_MAX_CONNECTIONS.
+api = jellyfin.JellyfinClient(CONFIG.get("JELLYFIN_URL", ""), CONFIG.get("API_KEY", ""), timeout=TIMEOUT,
+                              max_connections=CONFIG.get("HTTP_MAX_CONNECTIONS", 32),
+                              endpoint_limits=CONFIG.get("HTTP_ENDPOINT_LIMITS", {}), retries=3, backoff=0.2,
+                              adaptive=CONFIG.get("HTTP_ADAPTIVE", True), initial_concurrency=CONFIG.get("MAX_THREADS", 2),
+                              target_latency=CONFIG.get("HTTP_TARGET_LATENCY", 2.0))
+
+def log_http_stats(label):
+    s = api.stats()
+    logging.info(f"[*] HTTP after {label}: concurrency {s['concurrency']} ({s['increases']} up / {s['decreases']} down), "
+                 f"{s['requests']} requests, latency p50 {s['p50']}s p95 {s['p95']}s p99 {s['p99']}s, "
+                 f"{s['throttled']} throttled, {s['errors']} errors")
+
+def iter_items(path, params, page_size=None):
+    """Streams an Items query page by page (StartIndex/Limit) so no single response holds the whole library."""
+    return api.iter_items(path, params, page_size or CONFIG.get("PAGE_SIZE", 500))
+
+def aiter_items(path, params, page_size=None):
+    return api.aiter_items(path, params, page_size or CONFIG.get("PAGE_SIZE", 500))
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     conn.execute("CREATE TABLE IF NOT EXISTS user_prefs (user_id TEXT PRIMARY KEY, prefs TEXT, updated TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS manifest (root TEXT, folder TEXT, signature TEXT, PRIMARY KEY (root, folder))")
+    conn.execute("CREATE TABLE IF NOT EXISTS source_index (dir TEXT PRIMARY KEY, mtime REAL, dirs TEXT, files TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS user_recs (user_id TEXT PRIMARY KEY, fingerprint TEXT, recs TEXT, updated TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS catalog (cat TEXT, id TEXT, data TEXT, digest TEXT, PRIMARY KEY (cat, id))")
+    conn.execute("CREATE TABLE IF NOT EXISTS catalog_sync (cat TEXT PRIMARY KEY, sources TEXT, synced TEXT)")
     conn.commit()
     return conn
 
@@ -231,40 +284,146 @@ def normalize(d):
     m = max(d.values()) if d else 0
     return {k: v / m for k, v in d.items()} if m else d
 
+def recency_weight(days): return 1.5 if days < 30 else 1.0 if days < 90 else 0.6 if days < 365 else 0.3
+
+def played_date(item):
+    # Jellyfin reports the play date inside UserData; older payloads had it top-level
+    return item.get("LastPlayedDate") or (item.get("UserData") or {}).get("LastPlayedDate")
+
 def recency_multiplier(item):
-    last = item.get("LastPlayedDate")
+    last = played_date(item)
     if not last: return 0.7
     try:
         now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-        item_date = datetime.fromisoformat(last.replace("Z", ""))
-        days = (now_utc - item_date).days
-        return 1.5 if days < 30 else 1.0 if days < 90 else 0.6 if days < 365 else 0.3
+        item_date = datetime.fromisoformat(last.replace("Z", "")[:26])
+        return recency_weight((now_utc - item_date).days)
     except: return 0.7
 
-def analyze_user(user):
-    params = {"Recursive": "true", "Filters": "IsPlayed", "Fields": "Genres,People,CollectionName,LastPlayedDate,UserData", "Limit": 3000}
-    try: items = session.get(f"{CONFIG['JELLYFIN_URL']}/Users/{user['Id']}/Items", params=params, timeout=TIMEOUT).json().get("Items", [])
-    except: return empty_prefs(), False
+# --- PERSISTENT PROFILES (user_prefs table) ---
+# Profiles are stored as RAW weighted counts bucketed by play day, so recency decay
+# can be applied at read time and new plays can be folded in without a full re-download.
+def empty_profile(): return {"days": {}, "collections": [], "items": {}}
+def empty_bucket(): return {"genres": {}, "actors": {}, "directors": {}}
+
+def play_day(item):
+    last = played_date(item)
+    if not last: return "undated"
+    try: return datetime.fromisoformat(last.replace("Z", "")[:26]).date().isoformat()
+    except: return "undated"
+
+def fold_item(bucket, item, sign=1.0):
+    def bump(d, k, v):
+        d[k] = d.get(k, 0) + v * sign
+        if d[k] <= 1e-9: del d[k]
+    for g in item.get("Genres", []): bump(bucket["genres"], g, 1.0)
+    for p in item.get("People", []):
+        if p["Type"] == "Director": bump(bucket["directors"], p["Name"], 4.0)
+        elif p["Type"] == "Actor": bump(bucket["actors"], p["Name"], 2.0)
+
+def add_play(profile, item):
+    days, seen = profile["days"], profile["items"]
+    # A re-watched item moves to its new play day instead of being counted twice
+    old_day = seen.get(item["Id"])
+    if old_day in days:
+        fold_item(days[old_day], item, sign=-1.0)
+        if not any(days[old_day].values()): del days[old_day]
+    day = play_day(item)
+    fold_item(days.setdefault(day, empty_bucket()), item)
+    seen[item["Id"]] = day
+    last = played_date(item)
+    if last and last > (profile.get("last_played") or ""): profile["last_played"] = last
+    if item.get("CollectionName") and item["CollectionName"] not in profile["collections"]:
+        profile["collections"].append(item["CollectionName"])
+
+def compact_profile(profile):
+    """Merges every bucket older than a year into one 'old' bucket (they all decay to 0.3)."""
+    today = datetime.now(timezone.utc).date()
+    days, moved = profile["days"], set()
+    for day in [d for d in days if d not in ("old", "undated")]:
+        try:
+            if (today - datetime.fromisoformat(day).date()).days < 365: continue
+        except: pass
+        old = days.setdefault("old", empty_bucket())
+        for kind, counts in days.pop(day).items():
+            for k, v in counts.items(): old[kind][k] = old[kind].get(k, 0) + v
+        moved.add(day)
+    if moved: profile["items"] = {i: ("old" if d in moved else d) for i, d in profile["items"].items()}
+
+def profile_to_prefs(profile):
+    """Applies recency decay to the raw day buckets and returns normalized prefs."""
+    today = datetime.now(timezone.utc).date()
     prefs = empty_prefs()
-    for i in items:
-        w = recency_multiplier(i)
-        for g in i.get("Genres", []): prefs["genres"][g] = prefs["genres"].get(g, 0) + (1.0 * w)
-        for p in i.get("People", []):
-            if p["Type"] == "Director": prefs["directors"][p["Name"]] = prefs["directors"].get(p["Name"], 0) + (4.0 * w)
-            elif p["Type"] == "Actor": prefs["actors"][p["Name"]] = prefs["actors"].get(p["Name"], 0) + (2.0 * w)
-        if i.get("CollectionName"): prefs["collections"].add(i["CollectionName"])
+    for day, bucket in profile["days"].items():
+        if day == "undated": w = 0.7
+        elif day == "old": w = 0.3
+        else:
+            try: w = recency_weight((today - datetime.fromisoformat(day).date()).days)
+            except: w = 0.7
+        for kind in ("genres", "actors", "directors"):
+            for k, v in bucket[kind].items(): prefs[kind][k] = prefs[kind].get(k, 0) + v * w
     prefs["genres"] = normalize(prefs["genres"])
     prefs["actors"] = normalize(prefs["actors"])
     prefs["directors"] = normalize(prefs["directors"])
-    return prefs, len(items) >= 5
+    prefs["collections"] = set(profile["collections"])
+    return prefs
 
-def score_item(item, prefs, weights, cold):
+def load_profile(u_id):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try: row = conn.execute("SELECT prefs, updated FROM user_prefs WHERE user_id = ?", (u_id,)).fetchone()
+    finally: conn.close()
+    if not row: return None, None
+    try:
+        profile = json.loads(row[0])
+        if not all(k in profile for k in empty_profile()): return None, None
+        return profile, datetime.fromisoformat(row[1])
+    except: return None, None
+
+def save_profile(u_id, profile, checkpoint):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("INSERT OR REPLACE INTO user_prefs (user_id, prefs, updated) VALUES (?, ?, ?)", (u_id, json.dumps(profile), checkpoint.isoformat()))
+        conn.commit()
+    finally: conn.close()
+
+# The checkpoint is our clock, the filter is the server's: re-read a little before it (add_play is idempotent)
+PROFILE_OVERLAP = timedelta(minutes=10)
+
+async def analyze_user_async(user, full=False):
+    """Returns (prefs, has_history, stats)."""
+    params = {"Recursive": "true", "Filters": "IsPlayed", "Fields": "Genres,People,CollectionName,LastPlayedDate,UserData"}
+    profile, checkpoint = await asyncio.to_thread(load_profile, user['Id'])
+    # Periodic full rebuild picks up "mark unplayed" and metadata edits that deltas can't see
+    if full or (checkpoint and datetime.now(timezone.utc) - checkpoint > timedelta(days=CONFIG.get("PROFILE_REBUILD_DAYS", 30))):
+        profile = None
+    if profile is None: profile, checkpoint = empty_profile(), None
+    elif checkpoint: params["MinDateLastSavedForUser"] = (checkpoint - PROFILE_OVERLAP).strftime("%Y-%m-%dT%H:%M:%SZ")
+    started = datetime.now(timezone.utc)
+    try:
+        # Fold each page into the profile as it arrives instead of holding the full history
+        async for i in aiter_items(f"/Users/{user['Id']}/Items", params): add_play(profile, i)
+    except:
+        if checkpoint is None: return empty_prefs(), False, None
+        # Delta failed: keep serving the stored profile, retry from the same checkpoint next run
+        return profile_to_prefs(profile), len(profile["items"]) >= 5, None
+    compact_profile(profile)
+    try: await asyncio.to_thread(save_profile, user['Id'], profile, started)
+    except Exception as e: logging.warning(f"[!] Could not save profile for {user.get('Name')}: {e}")
+    # History summary used for dirty detection (None = history unknown this run)
+    stats = {"plays": len(profile["items"]), "last_played": profile.get("last_played")}
+    return profile_to_prefs(profile), len(profile["items"]) >= 5, stats
+
+def jitter(seed, item, salt=0):
+    # Seeded per (user, item, run) so repeated scoring of an item always agrees
+    if seed is None: return random.random()
+    return scoring.unit(seed ^ salt, scoring.stable_hash(item["Id"]))
+
+def score_item(item, prefs, weights, cold, seed=None):
     score = 0.0
     rating = item.get("CommunityRating", 0)
     is_music = item.get("Type") in ["MusicAlbum", "Audio"]
     if cold:
         if rating > 0: score = rating + 2.0
-        elif is_music: score = random.uniform(6.5, 9.5)
+        elif is_music: score = 6.5 + 3.0 * jitter(seed, item, scoring.COLD_SALT)
     else:
         score = float(rating) if rating > 0 else (7.0 if is_music else 5.0)
         for g in item.get("Genres", []): score += prefs["genres"].get(g, 0) * weights["genres"]
@@ -273,7 +432,7 @@ def score_item(item, prefs, weights, cold):
             elif p["Type"] == "Actor": score += prefs["actors"].get(p["Name"], 0) * weights["actors"]
         if item.get("CollectionName") in prefs["collections"]: score += weights["collection"]
         if item.get("UserData", {}).get("Played"): score -= weights["seen_penalty"]
-    score += random.uniform(0, weights["diversity"])
+    score += weights["diversity"] * jitter(seed, item)
     return score
 
 # --------------------------------------------------
@@ -299,52 +458,313 @@ def create_music_nfo(folder_path, artist, album):
                 f.write(f"<artist><name>{safe_artist}</name></artist>")
         except: pass
 
-def create_content(source_path, target_folder, is_music=False):
-    real_source = resolve_path(source_path)
-    if os.path.isdir(real_source):
-        target_folder.mkdir(parents=True, exist_ok=True)
-        for root, dirs, files in os.walk(real_source):
-            target_root = target_folder / os.path.relpath(root, real_source)
-            target_root.mkdir(parents=True, exist_ok=True)
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                src_file = os.path.join(root, file)
-                if ext in ['.mp3', '.flac', '.m4a', '.wav', '.ogg', '.mkv', '.mp4', '.avi', '.m4v', '.wmv', '.ts', '.mov', '.iso']:
-                    if is_music:
-                        tgt_link = target_root / file
-                        try:
-                            if tgt_link.exists(): os.remove(tgt_link)
-                            os.symlink(src_file, tgt_link)
-                        except: pass
-                    else:
-                        tgt_strm = target_root / (os.path.splitext(file)[0] + ".strm")
-                        try:
-                            with open(tgt_strm, "w", encoding="utf-8") as f: f.write(src_file)
-                        except: pass
-                elif ext in ['.jpg', '.jpeg', '.png', '.tbn', '.nfo']:
-                    tgt_file = target_root / file
-                    if not tgt_file.exists():
-                        try: shutil.copy2(src_file, tgt_file)
-                        except: pass
-    else:
-        target_folder.mkdir(parents=True, exist_ok=True)
-        tgt_file = target_folder / (os.path.basename(real_source) + ".strm")
+MEDIA_EXTS = ['.mp3', '.flac', '.m4a', '.wav', '.ogg', '.mkv', '.mp4', '.avi', '.m4v', '.wmv', '.ts', '.mov', '.iso']
+ART_EXTS = ['.jpg', '.jpeg', '.png', '.tbn', '.nfo']
+
+# --- SOURCE DIRECTORY INDEX (source_index table) ---
+# Listing of every source directory we have walked, keyed by its mtime. A directory's
+# mtime changes whenever an entry is added/removed/renamed in it, so one stat per
+# directory (at most once per run) replaces a full listing over SMB/NFS.
+SOURCE_INDEX = {}
+_index_dirty = set()
+_index_checked = set()
+_index_lock = threading.Lock()
+
+def load_source_index(fresh=False):
+    """Starts a run's view of the index; fresh=True (resync) drops it so every directory is listed again."""
+    global SOURCE_INDEX
+    _index_dirty.clear()
+    _index_checked.clear()
+    if fresh:
+        SOURCE_INDEX = {}
+        return
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        try: rows = conn.execute("SELECT dir, mtime, dirs, files FROM source_index").fetchall()
+        finally: conn.close()
+        SOURCE_INDEX = {d: (m, json.loads(ds), json.loads(fs)) for d, m, ds, fs in rows}
+    except Exception as e:
+        logging.warning(f"[!] Source index unavailable, walking shares directly: {e}")
+        SOURCE_INDEX = {}
+
+def save_source_index():
+    with _index_lock:
+        rows = [(d, SOURCE_INDEX[d][0], json.dumps(SOURCE_INDEX[d][1]), json.dumps(SOURCE_INDEX[d][2])) for d in _index_dirty if d in SOURCE_INDEX]
+        _index_dirty.clear()
+    if not rows: return
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
         try:
-            with open(tgt_file, "w", encoding="utf-8") as f: f.write(real_source)
-        except: pass
+            conn.executemany("INSERT OR REPLACE INTO source_index (dir, mtime, dirs, files) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+        finally: conn.close()
+        logging.info(f"[*] Source index: {len(rows)} directories refreshed")
+    except Exception as e: logging.warning(f"[!] Could not save source index: {e}")
+
+def scan_dir(path):
+    """Returns (subdirs, files) for a source directory, or None if it is not a directory."""
+    with _index_lock:
+        hit = SOURCE_INDEX.get(path)
+        if hit and path in _index_checked: return hit[1], hit[2]
+    try:
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode): return None
+    except OSError: return None
+    if hit and hit[0] == st.st_mtime:
+        with _index_lock: _index_checked.add(path)
+        return hit[1], hit[2]
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir() and not entry.is_symlink(): dirs.append(entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in MEDIA_EXTS + ART_EXTS: files.append(entry.name)
+                except OSError: pass
+    except OSError: return [], []
+    with _index_lock:
+        SOURCE_INDEX[path] = (st.st_mtime, dirs, files)
+        _index_dirty.add(path)
+        _index_checked.add(path)
+    return dirs, files
+
+def walk_source(top):
+    """os.walk() replacement served from the source index (top-down)."""
+    stack = [top]
+    while stack:
+        root = stack.pop()
+        listing = scan_dir(root)
+        if listing is None: continue
+        dirs, files = listing
+        yield root, dirs, files
+        stack.extend(os.path.join(root, d) for d in reversed(dirs))
+
+def content_plan(source_path, is_music=False):
+    """Files one item folder should contain: {relative target path: (kind, source file)}, kind is strm/link/copy."""
+    real_source = resolve_path(source_path)
+    if scan_dir(real_source) is None: return {os.path.basename(real_source) + ".strm": ("strm", real_source)}
+    plan = {}
+    for root, dirs, files in walk_source(real_source):
+        rel_root = os.path.relpath(root, real_source)
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            src_file = os.path.join(root, file)
+            if ext in MEDIA_EXTS:
+                if is_music: plan[os.path.normpath(os.path.join(rel_root, file))] = ("link", src_file)
+                else: plan[os.path.normpath(os.path.join(rel_root, os.path.splitext(file)[0] + ".strm"))] = ("strm", src_file)
+            elif ext in ART_EXTS: plan[os.path.normpath(os.path.join(rel_root, file))] = ("copy", src_file)
+    return plan
+
+def write_entry(target, kind, src_file):
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if kind == "strm":
+            with open(target, "w", encoding="utf-8") as f: f.write(src_file)
+        elif kind == "link":
+            if os.path.lexists(target): os.remove(target)
+            os.symlink(src_file, target)
+        else:
+            if target.exists(): return
+            shutil.copy2(src_file, target)
+            METRICS.add("bytes_copied", os.path.getsize(target))
+        METRICS.add("files_written")
+    except: pass
+
+def entry_current(target, kind, src_file):
+    """True if an existing target file already holds what the plan wants."""
+    try:
+        if kind == "strm":
+            with open(target, "r", encoding="utf-8") as f: return f.read() == src_file
+        if kind == "link": return os.readlink(target) == src_file
+        return target.exists()
+    except OSError: return False
+
+def create_content(source_path, target_folder, is_music=False, plan=None):
+    target_folder.mkdir(parents=True, exist_ok=True)
+    if plan is None: plan = content_plan(source_path, is_music)
+    for rel, (kind, src_file) in plan.items(): write_entry(target_folder / rel, kind, src_file)
+
+def sync_folder(folder, plan, keep=()):
+    """Rewrites only the missing/stale files of an existing item folder and removes the extra ones."""
+    changed = False
+    for root, dirs, files in os.walk(folder, topdown=False):
+        for file in files:
+            rel = os.path.normpath(os.path.relpath(os.path.join(root, file), folder))
+            if rel in plan or rel in keep: continue
+            safe_delete(os.path.join(root, file))
+            changed = True
+        if root != str(folder) and not os.listdir(root):
+            try: os.rmdir(root)
+            except OSError: pass
+    for rel, (kind, src_file) in plan.items():
+        if entry_current(folder / rel, kind, src_file): continue
+        write_entry(folder / rel, kind, src_file)
+        changed = True
+    return changed
 
 # --------------------------------------------------
-# LIBRARY MANAGEMENT
+# MATERIALIZER (Incremental)
 # --------------------------------------------------
-def get_library_mapping():
+def load_manifest(root):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try: return dict(conn.execute("SELECT folder, signature FROM manifest WHERE root = ?", (root,)).fetchall())
+    finally: conn.close()
+
+def save_manifest(root, entries):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("DELETE FROM manifest WHERE root = ?", (root,))
+        conn.executemany("INSERT INTO manifest (root, folder, signature) VALUES (?, ?, ?)", [(root, f, s) for f, s in entries.items()])
+        conn.commit()
+    finally: conn.close()
+
+def desired_folders(top, cat):
+    """Maps each relative item folder to the items that belong in it (same-name items share a folder)."""
+    desired = {}
+    for i in top:
+        clean = truncate_path(i["Name"]) or i["Id"]
+        if cat == "Music":
+            artist = truncate_path(i.get("AlbumArtist") or (i.get("Artists") or ["Unknown"])[0]) or "Unknown"
+            desired.setdefault(os.path.join(artist, clean), []).append(i)
+        else: desired.setdefault(clean, []).append(i)
+    return desired
+
+def folders_on_disk(out, cat):
+    depth = 2 if cat == "Music" else 1
+    found = set()
     try:
-        resp = session.get(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", timeout=TIMEOUT)
+        for entry in os.scandir(out):
+            if not entry.is_dir(): continue
+            if depth == 1: found.add(entry.name)
+            else: found.update(os.path.join(entry.name, sub.name) for sub in os.scandir(entry.path) if sub.is_dir())
+    except OSError: pass
+    return found
+
+def materialize(out, cat, top):
+    """
+    Brings `out` in line with `top` by touching only the item folders that changed,
+    so unchanged files keep their mtime and Jellyfin's scanner skips them.
+    A folder's signature covers its items and the file set of their source folders
+    (served from the source index): a kept folder whose source gained or lost files
+    only gets the missing/extra files rewritten.
+    Returns (added, removed) lists of absolute folder paths.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    root = str(out)
+    is_music = cat == "Music"
+    desired = desired_folders(top, cat)
+    items_sig, plans, wanted = {}, {}, {}
+    for rel, items in desired.items():
+        items_sig[rel] = "|".join(f"{i['Id']}={i['Path']}" for i in items)
+        plans[rel] = plan = {}
+        for i in items: plan.update(content_plan(i["Path"], is_music))
+        digest = hashlib.sha1(json.dumps(sorted(plan.items())).encode("utf-8")).hexdigest()
+        wanted[rel] = f"{items_sig[rel]}#{digest}"
+    try: known = load_manifest(root)
+    except: known = {}
+    on_disk = folders_on_disk(out, cat)
+    keep = ("album.nfo",) if is_music else ()
+    added, removed = [], []
+
+    def same_items(rel): return rel in on_disk and known.get(rel, "").split("#")[0] == items_sig[rel]
+
+    # 1. Drop folders that are no longer recommended (or whose items changed)
+    for rel in on_disk:
+        if rel in wanted and (known.get(rel) == wanted[rel] or same_items(rel)): continue
+        safe_delete(out / rel)
+        if rel not in wanted: removed.append(str(out / rel))
+    if is_music:
+        for artist in {os.path.dirname(rel) for rel in on_disk}:
+            artist_dir = out / artist
+            if artist_dir.exists() and not any(p.is_dir() for p in artist_dir.iterdir()): safe_delete(artist_dir)
+
+    # 2. Write the folders that are new (or were just invalidated), patch the ones whose source changed
+    for rel, items in desired.items():
+        folder = out / rel
+        if rel in on_disk and known.get(rel) == wanted[rel]: continue
+        if same_items(rel):
+            if sync_folder(folder, plans[rel], keep): added.append(str(folder))
+            continue
+        if is_music:
+            artist, clean = os.path.split(rel)
+            create_music_nfo(folder, artist, clean)
+        create_content(None, folder, is_music, plans[rel])
+        added.append(str(folder))
+
+    if wanted != known:
+        try: save_manifest(root, wanted)
+        except Exception as e: logging.warning(f"[!] Could not save manifest for {root}: {e}")
+    return added, removed
+
+# --------------------------------------------------
+# RUN SNAPSHOT (One fetch of the server state per run)
+# --------------------------------------------------
+# Options applied at creation time (sent in the AddVirtualFolder body, no follow-up call)
+LIBRARY_OPTIONS = {"EnableRealtimeMonitor": False, "EnableAutomaticSeriesGrouping": True}
+
+class RunSnapshot:
+    """
+    Run-scoped view of /Library/VirtualFolders and /Users.
+    Loaded once, then kept in sync locally with the libraries this run creates/deletes.
+    Jellyfin assigns ItemIds on creation, so those are resolved lazily (one refetch) when needed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.libraries = {}
+        self.users = []
+        self._unresolved = False
+
+    def load(self):
+        libs = api.get("/Library/VirtualFolders")
+        libs.raise_for_status()
+        users = api.get("/Users")
+        users.raise_for_status()
+        self.libraries = {l.get("Name", ""): l for l in libs.json()}
+        self.users = users.json()
+        self._unresolved = False
+        return self
+
+    def library(self, name):
+        with self._lock: return self.libraries.get(name)
+
+    def library_list(self, with_ids=False):
+        """All libraries; with_ids=True first refetches once if this run created any."""
+        if with_ids and self._unresolved:
+            try:
+                libs = api.get("/Library/VirtualFolders")
+                libs.raise_for_status()
+                with self._lock:
+                    self.libraries = {l.get("Name", ""): l for l in libs.json()}
+                    self._unresolved = False
+            except Exception as e: logging.warning(f"[!] Could not refresh library list: {e}")
+        with self._lock: return list(self.libraries.values())
+
+    def create_library(self, name, collection_type, path, refresh=True):
+        resp = api.post("/Library/VirtualFolders",
+                        params={"name": name, "collectionType": collection_type, "paths": [path], "refreshLibrary": str(refresh).lower()},
+                        json={"LibraryOptions": LIBRARY_OPTIONS})
         resp.raise_for_status()
-        libs = resp.json()
+        with self._lock:
+            self.libraries[name] = {"Name": name, "CollectionType": collection_type, "Locations": [path], "ItemId": None}
+            self._unresolved = True
+
+    def delete_library(self, name, refresh=False):
+        api.delete("/Library/VirtualFolders", params={"name": name, "refreshLibrary": str(refresh).lower()})
+        with self._lock: self.libraries.pop(name, None)
+
+# --------------------------------------------------
+# LIBRARY MANAGEMENT
+# --------------------------------------------------
+def get_library_mapping(snap):
+    try: libs = snap.load().library_list()
     except Exception as e:
         fatal(f"Connection to Jellyfin failed: {e}")
         return {}
     
+    # Our own discovery libraries share the source collection types: never use them as sources
+    root_marker = os.path.abspath(DATA_ROOT).lower()
+    libs = [l for l in libs if "\u200B" not in l.get("Name", "")
+            and not any(discovery_owner(loc, root_marker) is not None for loc in l.get("Locations") or [])]
     lib_map = {}
     for cat, cfg in LIBS.get("CATEGORIES", {}).items():
         if not cfg.get("enabled", False): continue
@@ -358,32 +778,59 @@ def get_library_mapping():
     return lib_map
 
 # --------------------------------------------------
-# POLICY SANITIZER (Prevents Ghost Libraries)
+# POLICY SYNC (Prevents Ghost Libraries)
 # --------------------------------------------------
-def sanitize_policies(deleted_ids):
+def policy_changed(old, new):
+    """True if the folder grant differs (order of EnabledFolders is irrelevant)."""
+    return (bool(old.get("EnableAllFolders")) != bool(new.get("EnableAllFolders"))
+            or set(old.get("EnabledFolders") or []) != set(new.get("EnabledFolders") or []))
+
+async def sync_policy(user, plan):
+    """
+    Applies plan(policy) -> new policy (or None) to one user; POSTs only on a real change.
+    The /Users summary is used for the diff when it carries the folder grant, and the full
+    user is only fetched when an update is actually needed.
+    Returns the new policy if it was sent, None if the user was already up to date.
+    """
+    summary = user.get("Policy") or {}
+    if "EnabledFolders" in summary:
+        target = plan(summary)
+        if target is None or not policy_changed(summary, target): return None
+    # The summary may be incomplete: build the update from the full policy
+    full = await api.aget(f"/Users/{user['Id']}")
+    full.raise_for_status()
+    policy = (full.json() or {}).get("Policy", {})
+    target = plan(policy)
+    if target is None or not policy_changed(policy, target): return None
+    resp = await api.apost(f"/Users/{user['Id']}/Policy", json={**policy, **target})
+    resp.raise_for_status()
+    user["Policy"] = {**policy, **target}
+    return target
+
+def sync_policies(users, plan_for):
+    """Runs sync_policy for every user in parallel; plan_for(user) returns that user's plan."""
+    results = api.gather([sync_policy(u, plan_for(u)) for u in users])
+    changed = [(u, r) for u, r in zip(users, results) if r and not isinstance(r, BaseException)]
+    failed = [(u, r) for u, r in zip(users, results) if isinstance(r, BaseException)]
+    for u, e in failed: logging.warning(f"[!] Policy update failed for {u.get('Name')}: {e}")
+    return changed, failed
+
+def sanitize_policies(deleted_ids, users=None):
     """Removes list of ItemIds from all users' EnabledFolders."""
     if not deleted_ids: return
+    deleted = set(deleted_ids)
+    def plan(policy):
+        enabled = policy.get("EnabledFolders") or []
+        if not deleted.intersection(enabled): return None
+        return {"EnabledFolders": [uid for uid in enabled if uid not in deleted]}
     try:
-        users = session.get(f"{CONFIG['JELLYFIN_URL']}/Users", timeout=TIMEOUT).json()
-        for user in users:
-            try:
-                # Fetch full user to get current policy
-                u_data = session.get(f"{CONFIG['JELLYFIN_URL']}/Users/{user['Id']}", timeout=TIMEOUT).json()
-                policy = u_data.get("Policy", {})
-                enabled = policy.get("EnabledFolders", [])
-                
-                # Check if this user has any of the deleted IDs
-                if any(uid in deleted_ids for uid in enabled):
-                    new_enabled = [uid for uid in enabled if uid not in deleted_ids]
-                    policy["EnabledFolders"] = new_enabled
-                    session.post(f"{CONFIG['JELLYFIN_URL']}/Users/{user['Id']}/Policy", json=policy, timeout=TIMEOUT)
-            except: pass
+        if users is None: users = api.get("/Users").json()
+        sync_policies(users, lambda u: plan)
     except: pass
 
-def cleanup_stale_libraries(lib_map):
+def cleanup_stale_libraries(lib_map, snap):
     logging.info("[*] Scanning for stale discovery libraries...")
-    try: current_libs = session.get(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", timeout=TIMEOUT).json()
-    except: return
+    current_libs = snap.library_list()
     
     ZW = "\u200B"
     # Libraries we EXPECT to exist based on current config
@@ -414,224 +861,664 @@ def cleanup_stale_libraries(lib_map):
     
     # 1. Delete from Jellyfin
     for name in to_del_names:
-        try: session.delete(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", params={"name": name, "refreshLibrary": "false"})
+        try: snap.delete_library(name)
         except: pass
         
     # 2. Remove Ghost Icons from Users
-    sanitize_policies(to_del_ids)
+    sanitize_policies(to_del_ids, snap.users)
 
-def optimize_library(library_name):
-    try:
-        all_libs = session.get(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", timeout=TIMEOUT).json()
-        target = next((l for l in all_libs if l.get('Name') == library_name), None)
-        if not target: return
-        session.post(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders/LibraryOptions", json={
-            "Id": target['ItemId'], "LibraryOptions": {"EnableRealtimeMonitor": False, "EnableAutomaticSeriesGrouping": True}
-        }, timeout=TIMEOUT)
+def notify_media_updated(added, removed):
+    """Tells Jellyfin exactly which paths changed instead of rescanning the whole library."""
+    updates = [{"Path": p, "UpdateType": "Created"} for p in added] + [{"Path": p, "UpdateType": "Deleted"} for p in removed]
+    if not updates: return
+    try: api.post("/Library/Media/Updated", json={"Updates": updates})
+    except Exception as e: logging.warning(f"[!] Media update notification failed: {e}")
+
+def same_location(lib, path):
+    locs = [os.path.normcase(os.path.abspath(p)) for p in lib.get("Locations", [])]
+    return locs == [os.path.normcase(os.path.abspath(path))]
+
+def register_stable_library(name, meta, out, added, removed, snap):
+    """
+    STABLE_LIBRARIES mode: keeps the VirtualFolder and only reports changed paths.
+    The library is (re)created only when it is missing or points somewhere else.
+    """
+    lib = snap.library(name)
+    if lib and same_location(lib, str(out)):
+        notify_media_updated(added, removed)
+        return
+    if lib:
+        try: snap.delete_library(name)
+        except: pass
+    try: snap.create_library(name, meta["collection_type"], str(out))
     except: pass
 
-def process_user(user, lib_map, index):
+# --------------------------------------------------
+# SHARED CATALOG (Stored in jelly_data.db, synced incrementally)
+# --------------------------------------------------
+# The first run (and a resync, or a change of source libraries) downloads everything.
+# Later runs only fetch items saved since the high-water mark (MinDateLastSaved) plus
+# a bare Id list whose diff against the stored rows finds deletions.
+CATALOG_FIELDS = "Path,CommunityRating,Genres,People,CollectionName,AlbumArtist,Artists"
+CATALOG_OVERLAP = timedelta(minutes=10)  # Re-fetch a little before the mark: tolerates clock skew with the server
+
+def item_digest(data):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+def catalog_version(digests):
+    """Content version of a category from its per-item digests (in Id order)."""
+    h = hashlib.blake2b(digest_size=16)
+    for d in digests: h.update(d.encode("ascii"))
+    return h.hexdigest()
+
+def catalog_params(meta, **extra):
+    return {"ParentIds": ",".join(meta["source_ids"]), "IncludeItemTypes": meta["item_type"], "Recursive": "true", "EnableUserData": "false", **extra}
+
+def fetch_catalog_rows(meta, since=None):
+    """{Id: (data, digest)} for every item (or those saved since the mark); None marks items without a Path."""
+    params = catalog_params(meta, Fields=CATALOG_FIELDS)
+    if since: params["MinDateLastSaved"] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+    rows = {}
+    for i in iter_items("/Items", params):
+        if not i.get("Path"):
+            rows[i["Id"]] = None
+            continue
+        data = json.dumps(catalogs.Item.from_json(i).to_json(), sort_keys=True)
+        rows[i["Id"]] = (data, item_digest(data))
+    return rows
+
+def fetch_catalog_ids(meta):
+    """Every current item Id, without metadata (large pages: these responses are tiny)."""
+    params = catalog_params(meta, EnableImages="false")
+    return {i["Id"] for i in iter_items("/Items", params, CONFIG.get("PAGE_SIZE", 500) * 10)}
+
+def sync_catalog(cat, meta, full=False):
+    """Brings one category's stored catalog up to date; returns (records, version)."""
+    sources = json.dumps([sorted(meta["source_ids"]), meta["item_type"]])
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        row = conn.execute("SELECT sources, synced FROM catalog_sync WHERE cat = ?", (cat,)).fetchone()
+        since = datetime.fromisoformat(row[1]) - CATALOG_OVERLAP if row and row[0] == sources and not full else None
+        started = datetime.now(timezone.utc)
+        try:
+            rows = fetch_catalog_rows(meta, since)
+            current = fetch_catalog_ids(meta) if since else None
+        except Exception as e:
+            # Keep serving the stored catalog (if any); the mark is not advanced
+            logging.warning(f"[!] Catalog fetch failed for {cat}: {e}")
+            if not row or row[0] != sources: return [], None
+        else:
+            if since is None: conn.execute("DELETE FROM catalog WHERE cat = ?", (cat,))
+            gone = [i for i, v in rows.items() if v is None]
+            if current is not None:
+                gone += [i for (i,) in conn.execute("SELECT id FROM catalog WHERE cat = ?", (cat,)) if i not in current and i not in rows]
+            conn.executemany("DELETE FROM catalog WHERE cat = ? AND id = ?", [(cat, i) for i in gone])
+            conn.executemany("INSERT OR REPLACE INTO catalog (cat, id, data, digest) VALUES (?, ?, ?, ?)",
+                             [(cat, i, v[0], v[1]) for i, v in rows.items() if v is not None])
+            conn.execute("INSERT OR REPLACE INTO catalog_sync (cat, sources, synced) VALUES (?, ?, ?)", (cat, sources, started.isoformat()))
+            conn.commit()
+            changed = sum(v is not None for v in rows.values())
+            METRICS.add("catalog_changed", changed)
+            METRICS.add("catalog_removed", len(gone))
+            if since is None: logging.info(f"[*] Catalog: full download of {cat} ({changed} items)")
+            else: logging.info(f"[*] Catalog: {cat} synced, {changed} changed, {len(gone)} removed")
+        items, digests = [], []
+        for data, digest in conn.execute("SELECT data, digest FROM catalog WHERE cat = ? ORDER BY id", (cat,)):
+            items.append(catalogs.Item.from_json(json.loads(data)))
+            digests.append(digest)
+        return items, catalog_version(digests)
+    finally: conn.close()
+
+def build_catalog(lib_map, full=False):
+    """Each category's candidate records (shared by every user) and their content versions."""
+    catalog, versions = {}, {}
+    for cat, meta in lib_map.items():
+        try: catalog[cat], versions[cat] = sync_catalog(cat, meta, full)
+        except Exception as e:
+            logging.warning(f"[!] Catalog unavailable for {cat}: {e}")
+            catalog[cat], versions[cat] = [], None
+        logging.info(f"[*] Catalog: {len(catalog[cat])} {cat} candidates")
+        progress_advance()
+    return catalog, versions
+
+async def get_played_ids(u_id, meta):
+    """Lightweight per-user overlay: only the Ids of items this user has already played."""
+    params = {"ParentIds": ",".join(meta["source_ids"]), "IncludeItemTypes": meta["item_type"], "Recursive": "true", "Filters": "IsPlayed", "EnableUserData": "false", "EnableImages": "false"}
+    return {i["Id"] async for i in aiter_items(f"/Users/{u_id}/Items", params)}
+
+# The shared catalog comes from /Items, which ignores parental controls. Users with any
+# restriction get one bare Id listing per category from their own view (the server applies
+# the rating/tag rules), and catalog items outside it are never recommended to them.
+RESTRICTION_KEYS = ("MaxParentalRating", "BlockedTags", "AllowedTags", "BlockUnratedItems")
+
+def content_restrictions(user):
+    """Parental-control part of the user's Policy ({} when unrestricted)."""
+    policy = user.get("Policy") or {}
+    return {k: policy[k] for k in RESTRICTION_KEYS if policy.get(k) not in (None, [], "")}
+
+async def get_visible_ids(u_id, meta):
+    params = {"ParentIds": ",".join(meta["source_ids"]), "IncludeItemTypes": meta["item_type"], "Recursive": "true", "EnableUserData": "false", "EnableImages": "false"}
+    return {i["Id"] async for i in aiter_items(f"/Users/{u_id}/Items", params, CONFIG.get("PAGE_SIZE", 500) * 10)}
+
+def excluded_ids(ctx, cat, items):
+    """Ids never recommended to this user: played, plus catalog items hidden by their parental controls."""
+    played = ctx["played"][cat]
+    visible = ctx.get("visible", {}).get(cat)
+    if visible is None: return played
+    return played | {i["Id"] for i in items if i["Id"] not in visible}
+
+def category_weights(cat):
+    return CATEGORY_WEIGHTS.get(cat, CONFIG.get("SCORING", {}).get("DISCOVERY_BIAS", {}).get("Movies"))
+
+async def analyze_stage(user, lib_map, full=False, reuse=None):
+    """
+    Stage 1: Builds the user's profile and fetches their played overlay per category.
+    reuse(stats) -> True means the stored recommendations are still valid: overlays are skipped.
+    """
+    prefs, has_history, stats = await analyze_user_async(user, full)
+    logging.info(f"[*] Analyzing: {user['Name']}")
+    if reuse is not None and stats is not None and reuse(stats):
+        return {"prefs": prefs, "cold": not has_history, "stats": stats, "reuse": True}
+    cats = [cat for cat in lib_map if not (cat == "Music" and not CAN_SYMLINK)]
+    restricted = bool(content_restrictions(user))
+    overlays = [get_played_ids(user['Id'], lib_map[cat]) for cat in cats]
+    if restricted: overlays += [get_visible_ids(user['Id'], lib_map[cat]) for cat in cats]
+    results = await asyncio.gather(*overlays, return_exceptions=True)
+    # A failed overlay skips that category for this user, same as a failed candidate fetch
+    ok = lambda r: not isinstance(r, BaseException)
+    played = {cat: r for cat, r in zip(cats, results) if ok(r)}
+    ctx = {"prefs": prefs, "cold": not has_history, "stats": stats, "played": played}
+    if restricted:
+        ctx["visible"] = {cat: r for cat, r in zip(cats, results[len(cats):]) if ok(r)}
+        ctx["played"] = {cat: ids for cat, ids in played.items() if cat in ctx["visible"]}
+    return ctx
+
+def rank_candidates(items, ctx, weights, min_score):
+    """Pure-Python fallback: scores each item ONCE and keeps a bounded top-K heap."""
+    k = CONFIG.get("RECOMMENDATION_COUNT", 25)
+    played, prefs, cold, seed = ctx["played"], ctx["prefs"], ctx["cold"], ctx["seed"]
+    scored = ((score_item(i, prefs, weights, cold, seed), n) for n, i in enumerate(items) if i["Id"] not in played)
+    return [items[n] for _, n in heapq.nlargest(k, (s for s in scored if s[0] >= min_score), key=lambda s: s[0])]
+
+def scoring_pool(n_users):
+    """(pool, workers) for Stage 2 when SCORING_PROCESSES > 1 (vectorized scorer only), else (None, 0)."""
+    workers = min(CONFIG.get("SCORING_PROCESSES", 0), os.cpu_count() or 1, n_users)
+    if workers < 2 or not scoring.available(): return None, 0
+    try: pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    except Exception as e:
+        logging.warning(f"[!] Process pool unavailable, scoring in-process: {e}")
+        return None, 0
+    logging.info(f"[*] Scoring across {workers} worker processes")
+    return pool, workers
+
+def rank_in_pool(pool, workers, matrix, profiles, weights, min_score, k, excludes):
+    """Shards users across the pool; workers memory-map ONE exported copy of the category."""
+    path = matrix.export(tempfile.mkdtemp(prefix="jellydiscover-scoring-"))
+    try:
+        futures = [(s.start, pool.submit(scoring.score_shard, path, profiles[s], weights, min_score, k, excludes[s]))
+                   for s in scoring.shards(len(profiles), workers)]
+        return [(start + pos, top) for start, f in futures for pos, top in f.result()]
+    finally: shutil.rmtree(path, ignore_errors=True)
+
+def rank_all(users, contexts, catalog, lib_map, run_id):
+    """Stage 2: Scores every user against each category's catalog in one batch."""
+    recs = {u['Id']: {} for u in users}
+    seeds = {u['Id']: scoring.user_seed(run_id, u['Id']) for u in users}
+    k = CONFIG.get("RECOMMENDATION_COUNT", 25)
+    pool, workers = scoring_pool(len(users))
+    try:
+        for cat, meta in lib_map.items():
+            items = catalog.get(cat, [])
+            todo = [u['Id'] for u in users if u['Id'] in contexts and cat in contexts[u['Id']]["played"]]
+            if not items or not todo: continue
+            weights = category_weights(cat)
+            if not scoring.available():
+                for u_id in todo:
+                    ctx = {**contexts[u_id], "played": excluded_ids(contexts[u_id], cat, items), "seed": seeds[u_id]}
+                    recs[u_id][cat] = rank_candidates(items, ctx, weights, meta["min_score"])
+                continue
+            matrix = scoring.CategoryMatrix(items)
+            profiles = [(contexts[u_id]["prefs"], contexts[u_id]["cold"], seeds[u_id]) for u_id in todo]
+            excludes = [matrix.lookup(excluded_ids(contexts[u_id], cat, items)) for u_id in todo]
+            if pool and len(todo) > 1:
+                ranked = rank_in_pool(pool, workers, matrix, profiles, weights, meta["min_score"], k, excludes)
+            else:
+                ranked = ((pos, scoring.top_k(scores, meta["min_score"], k, exclude=excludes[pos]))
+                          for pos, scores in matrix.score_users(profiles, weights))
+            for pos, top in ranked: recs[todo[pos]][cat] = [items[j] for j in top]
+    finally:
+        if pool: pool.shutdown()
+    return recs
+
+# --------------------------------------------------
+# DIRTY DETECTION (Skip users with nothing new)
+# --------------------------------------------------
+# A user's recommendations are reused when the fingerprint of everything they depend on
+# (history summary, candidate catalog, scoring/library settings, library slot, parental controls) is unchanged.
+def settings_signature(lib_map):
+    cats = {cat: {**meta, "weights": category_weights(cat)} for cat, meta in lib_map.items()}
+    return json.dumps({"cats": cats, "count": CONFIG.get("RECOMMENDATION_COUNT", 25), "symlinks": CAN_SYMLINK,
+                       "stable": CONFIG.get("STABLE_LIBRARIES", False), "root": os.path.abspath(DATA_ROOT)}, sort_keys=True, default=str)
+
+def user_fingerprint(user, index, stats, versions, settings):
+    raw = json.dumps([user['Id'], user['Name'], index, stats, versions, settings, content_restrictions(user)], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def load_user_recs():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try: return {u: (fp, json.loads(r)) for u, fp, r in conn.execute("SELECT user_id, fingerprint, recs FROM user_recs")}
+    finally: conn.close()
+
+def save_user_recs(u_id, fingerprint, recs):
+    ids = {cat: [i["Id"] for i in items] for cat, items in recs.items()}
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("INSERT OR REPLACE INTO user_recs (user_id, fingerprint, recs, updated) VALUES (?, ?, ?, ?)",
+                     (u_id, fingerprint, json.dumps(ids), datetime.now(timezone.utc).isoformat()))
+        conn.commit()
+    finally: conn.close()
+
+def outputs_intact(user, index, lib_map, cats, snap):
+    """True if every stored category still has its folder on disk and its library in Jellyfin."""
+    safe_name = truncate_path(user['Name'] or user['Id'])
+    for cat in cats:
+        if cat not in lib_map: return False
+        out = Path(DATA_ROOT) / safe_name / cat
+        lib = snap.library(f"{lib_map[cat]['discovery_name']}{chr(0x200B) * (index + 1)}")
+        if not out.is_dir() or not lib or not same_location(lib, str(out)): return False
+    return True
+
+def refresh_reused(user, lib_map, recs, by_id):
+    """
+    A reused user skips scoring and registration, but their folders still follow the source
+    tree (new episodes of a kept show): the manifest diff re-runs on the stored picks and
+    only the changed paths are reported to Jellyfin.
+    """
+    safe_name = truncate_path(user['Name'] or user['Id'])
+    for cat, ids in recs.items():
+        if cat not in lib_map: continue
+        top = [by_id[cat][i] for i in ids if i in by_id[cat]]
+        with METRICS.stage("materialize"): added, removed = materialize(Path(DATA_ROOT) / safe_name / cat, cat, top)
+        if not added and not removed: continue
+        METRICS.add("folders_written", len(added))
+        METRICS.add("folders_removed", len(removed))
+        logging.info(f"    - {user['Name']}/{cat}: {len(added)} folders updated from source, {len(removed)} removed")
+        notify_media_updated(added, removed)
+
+def process_user(user, lib_map, index, recs, snap):
+    """Stage 3: Writes the user's recommendations to disk and registers their libraries."""
     u_name, u_id = user['Name'], user['Id']
-    prefs, has_history = analyze_user(user)
-    logging.info(f"[*] Analyzing: {u_name}")
     safe_name = truncate_path(u_name or u_id)
     invisible_suffix = "\u200B" * (index + 1)
+    started = time.perf_counter()
     
     for cat, meta in lib_map.items():
-        if cat == "Music" and not CAN_SYMLINK: continue
+        if cat not in recs: continue
+        top = recs[cat]
         
-        # 1. Prepare Local Folders
+        # 1. Sync Local Folders (only the differing item folders are touched)
         out = Path(DATA_ROOT) / safe_name / cat
-        params = {"ParentIds": ",".join(meta["source_ids"]), "IncludeItemTypes": meta["item_type"], "Recursive": "true", "Filters": "IsUnplayed", "Fields": "Path,CommunityRating,Genres,People,CollectionName,UserData,AlbumArtist,Artists", "Limit": 600}
-        
-        try: items = session.get(f"{CONFIG['JELLYFIN_URL']}/Users/{u_id}/Items", params=params, timeout=TIMEOUT).json().get("Items", [])
-        except: items = []
-        if not items: continue
-        
-        weights = CATEGORY_WEIGHTS.get(cat, CONFIG.get("SCORING", {}).get("DISCOVERY_BIAS", {}).get("Movies"))
-        scored = sorted([i for i in items if i.get("Path") and score_item(i, prefs, weights, not has_history) >= meta["min_score"]], key=lambda x: score_item(x, prefs, weights, not has_history), reverse=True)
-        top = scored[:CONFIG.get("RECOMMENDATION_COUNT", 25)]
-        
-        if out.exists(): safe_delete(out)
-        out.mkdir(parents=True, exist_ok=True)
-        
-        for i in top:
-            clean = truncate_path(i["Name"])
-            if cat == "Music":
-                artist = truncate_path(i.get("AlbumArtist") or (i.get("Artists") or ["Unknown"])[0])
-                folder = out / artist / clean
-                create_music_nfo(folder, artist, clean)
-                create_content(i["Path"], folder, is_music=True)
-            else: create_content(i["Path"], out / clean, is_music=False)
+        with METRICS.stage("materialize"): added, removed = materialize(out, cat, top)
+        METRICS.add("folders_written", len(added))
+        METRICS.add("folders_removed", len(removed))
+        logging.info(f"    - {u_name}/{cat}: {len(added)} folders written, {len(removed)} removed")
             
         final_name = f"{meta['discovery_name']}{invisible_suffix}"
         
+        if CONFIG.get("STABLE_LIBRARIES", False):
+            with METRICS.stage("register"): register_stable_library(final_name, meta, out, added, removed, snap)
+            continue
+        
         # --- FIX: Pre-emptive Delete ---
         # We must delete the existing library to prevent "Discover Movies 2" 
         # and to force the database to clear out "Ghost Items".
-        try:
-            session.delete(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", 
-                           params={"name": final_name, "refreshLibrary": "false"}, 
-                           timeout=TIMEOUT)
-        except: pass
-        # -------------------------------
+        with METRICS.stage("register"):
+            try: snap.delete_library(final_name)
+            except: pass
+            # -------------------------------
 
-        try:
-            session.post(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", 
-                         params={"name": final_name, "collectionType": meta["collection_type"], "paths": [str(out)], "refreshLibrary": "true"}, 
-                         json={}, 
-                         timeout=TIMEOUT)
-            optimize_library(final_name)
-        except: pass
-        
+            try: snap.create_library(final_name, meta["collection_type"], str(out))
+            except: pass
+    
+    METRICS.user_time(u_name, time.perf_counter() - started)
+    METRICS.add("users_processed")
     return u_name
 
-def apply_strict_privacy():
+def discovery_owner(location, root_marker):
+    """Returns the lower-cased per-user folder of a path inside DATA_ROOT, or None if the path is not ours."""
+    loc = os.path.abspath(location).lower()
+    pos = loc.find(root_marker)
+    if pos < 0: return None
+    parts = loc[pos + len(root_marker):].strip(os.sep).split(os.sep)
+    return parts[0] if len(parts) > 1 and parts[0] else ""
+
+def apply_strict_privacy(snap):
     logging.info("[*] Applying Privacy Shield...")
     try:
-        # Get all users and all libraries
-        users = session.get(f"{CONFIG['JELLYFIN_URL']}/Users", timeout=TIMEOUT).json()
-        libs = session.get(f"{CONFIG['JELLYFIN_URL']}/Library/VirtualFolders", timeout=TIMEOUT).json()
+        # All users and all libraries (Ids of libraries created this run are resolved here)
+        users = snap.users
+        libs = snap.library_list(with_ids=True)
+        # A grant with a null folder Id would be wrong: leave every policy as is until the next run
+        unresolved = [l.get('Name', '') for l in libs if l.get('Locations') and not l.get('ItemId')]
+        if unresolved:
+            logging.warning(f"[!] Privacy Shield skipped: {len(unresolved)} libraries have no Id yet ({', '.join(map(repr, unresolved[:3]))})")
+            return
         
         # 1. Normalize Root Path for comparison (Lower case, consistent slashes)
         # We use the script's known DATA_ROOT to identify which libraries are "Ours"
         root_marker = os.path.abspath(DATA_ROOT).lower()
         
-        real_libs = []
-        discovery_libs = []
-
-        # 2. Sort libraries into "Real" (User's media) and "Discovery" (Our generated ones)
+        # 2. Sort libraries into "Real" (User's media) and "Discovery" (Our generated ones),
+        # indexing discovery libraries by owner folder once: .../JellyDiscover/SafeName/Movies
+        public_ids = []
+        owned = {}
         for l in libs:
             locs = l.get('Locations', [])
             if not locs: continue
-            
-            # Check if ANY path in this library lives inside our DATA_ROOT
-            is_generated = False
-            for loc in locs:
-                # We simply check if our Root Folder appears in the library path
-                # This works even if network shares or drive mappings differ slightly
-                if root_marker in os.path.abspath(loc).lower():
-                    is_generated = True
-                    break
-            
-            if is_generated:
-                discovery_libs.append(l)
-            else:
-                real_libs.append(l)
-
-        public_ids = [l['ItemId'] for l in real_libs]
+            owners = {discovery_owner(loc, root_marker) for loc in locs} - {None}
+            if not owners:
+                public_ids.append(l['ItemId'])
+                continue
+            for owner in owners - {""}: owned.setdefault(owner, []).append(l['ItemId'])
         
-        # 3. Assign Permissions
-        for user in users:
-            # Calculate the expected folder name for this user (e.g., "TrevyrPhillips")
-            safe_name = truncate_path(user['Name'] or user['Id'])
-            user_discovery_ids = []
-            
-            # Search our discovery libraries for ones containing this user's safe_name
-            # We look for:  .../JellyDiscover/SafeName/Movies...
-            expected_part = f"{os.sep}{safe_name}{os.sep}".lower()
-            
-            for dl in discovery_libs:
-                locs = dl.get('Locations', [])
-                for loc in locs:
-                    if expected_part in os.path.abspath(loc).lower():
-                        user_discovery_ids.append(dl['ItemId'])
-                        break
-            
-            # FETCH FULL POLICY: The /Users endpoint only returns a summary. 
-            # We fetch the specific user to get their complete current policy first.
-            try:
-                full_user = session.get(f"{CONFIG['JELLYFIN_URL']}/Users/{user['Id']}", timeout=TIMEOUT).json()
-                current_policy = full_user.get("Policy", {})
-            except:
-                # Fallback to summary if fetch fails
-                current_policy = user.get("Policy", {})
-
-            # Construct the new policy
-            new_policy = {
-                **current_policy,
-                "EnableAllFolders": False,
-                "EnabledFolders": public_ids + user_discovery_ids
-            }
-            
-            # Send the update
-            session.post(f"{CONFIG['JELLYFIN_URL']}/Users/{user['Id']}/Policy", json=new_policy, timeout=TIMEOUT)
-            
-            logging.info(f"    - Secured {user['Name']}: Visible = {len(public_ids)} Real + {len(user_discovery_ids)} Discovery")
+        # 3. Assign Permissions (only users whose folder grant actually changes get a POST)
+        def plan_for(user):
+            user_discovery_ids = owned.get(truncate_path(user['Name'] or user['Id']).lower(), [])
+            target = {"EnableAllFolders": False, "EnabledFolders": public_ids + user_discovery_ids}
+            return lambda policy: target
+        
+        changed, failed = sync_policies(users, plan_for)
+        for user, target in changed:
+            n_disc = len(target["EnabledFolders"]) - len(public_ids)
+            logging.info(f"    - Secured {user['Name']}: Visible = {len(public_ids)} Real + {n_disc} Discovery")
+        logging.info(f"[*] Privacy Shield: {len(changed)} updated, {len(users) - len(changed) - len(failed)} unchanged, {len(failed)} failed")
             
     except Exception as e:
         logging.error(f"[!] Privacy Shield Failed: {e}")
 
-def run_task():
+def run_task(full=False):
+    """One discovery run. full=True (catalog resync) re-downloads the catalog, rebuilds every profile and rescans the source folders."""
     # --- HOT RELOAD FIX: Refresh Config & Libraries ---
     # This ensures Dashboard changes apply instantly without service restart
-    global CONFIG, LIBS
+    global CONFIG, LIBS, METRICS
     CONFIG = utils.load_config()
     LIBS = utils.load_libraries()
     
-    # Update Session Headers with potentially new API Key
-    session.headers.update({"X-Emby-Token": CONFIG.get("API_KEY", "")})
+    # Update the client with a potentially new URL / API Key
+    api.configure(CONFIG.get("JELLYFIN_URL", ""), CONFIG.get("API_KEY", ""))
+    api.reset_stats()
 
     # FATAL ERROR CHECK 1: Missing API Key
     if not CONFIG.get("API_KEY"):
         fatal("API Key is missing in config.json. Please configure it in the dashboard.")
 
     send_notification("JellyDiscover", "Starting update...")
+    # Seeds the diversity jitter; re-using a run id reproduces that run's picks
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    logging.info(f"[*] Run ID: {run_id}{' (full resync)' if full else ''}")
+    METRICS = utils.RunMetrics("engine", run_id)
+    api.observer = METRICS.record_http
     startup_local_cleanup()
     init_db()
     update_drive_mappings()
     check_symlink_rights()
     
     # FATAL ERROR CHECK 2: Connection failure (handled inside get_library_mapping via fatal())
-    lib_map = get_library_mapping()
+    snap = RunSnapshot()
+    lib_map = get_library_mapping(snap)
     
     if not lib_map:
         logging.warning("[!] No libraries configured enabled in libraries.json.")
         return # Not fatal, just nothing to do this run
     
-    cleanup_stale_libraries(lib_map)
+    with run_stage("cleanup"): cleanup_stale_libraries(lib_map, snap)
     try:
-        users = session.get(f"{CONFIG['JELLYFIN_URL']}/Users", timeout=TIMEOUT).json()
+        with run_stage("fetch", len(lib_map), "categories"): catalog, versions = build_catalog(lib_map, full)
+        log_http_stats("catalog")
+        users = snap.users
+        
+        # Dirty detection: users whose fingerprint is unchanged keep their stored recommendations
+        settings = settings_signature(lib_map)
+        expected = [cat for cat in lib_map if catalog.get(cat) and not (cat == "Music" and not CAN_SYMLINK)]
+        try: stored = {} if full else load_user_recs()
+        except Exception as e:
+            logging.warning(f"[!] Could not load stored recommendations: {e}")
+            stored = {}
+        def reuse_check(user, index):
+            if user['Id'] not in stored: return None
+            fp, recs = stored[user['Id']]
+            return lambda stats: fp == user_fingerprint(user, index, stats, versions, settings) and outputs_intact(user, index, lib_map, recs, snap)
         
         # USE THREAD COUNT FROM CONFIG
         thread_count = CONFIG.get("MAX_THREADS", 2)
         logging.info(f"[*] Starting processing with {thread_count} threads...")
         
         with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as ex:
-            # We map process_user over the users list
-            for res in ex.map(lambda u: process_user(u, lib_map, users.index(u)), users): 
-                if res: logging.info(f"    [DONE] {res}")
+            # 1. Profiles + played overlays (network bound, all users in flight on the async client)
+            async def analyze_and_count(u, n):
+                try: return await analyze_stage(u, lib_map, full, reuse_check(u, n))
+                finally: progress_advance()
+            with run_stage("analysis", len(users)):
+                results = api.gather([analyze_and_count(u, n) for n, u in enumerate(users)])
+            contexts = {u['Id']: r for u, r in zip(users, results) if not isinstance(r, BaseException)}
+            idle = {u_id for u_id, c in contexts.items() if c.get("reuse")}
+            dirty = [u for u in users if u['Id'] not in idle]
+            logging.info(f"[*] {len(dirty)} users changed, {len(idle)} unchanged (stored recommendations reused)")
+            METRICS.add("users_skipped", len(idle))
+            log_http_stats("profiles")
+            
+            # 2. Batch scoring (CPU bound, vectorized when NumPy is available)
+            logging.info(f"[*] Scoring {len(dirty)} users ({'vectorized' if scoring.available() else 'pure-python'})...")
+            with run_stage("scoring", len(dirty)):
+                recs = rank_all(dirty, contexts, catalog, lib_map, run_id)
+                progress_advance(len(dirty))
+            
+            def process_and_record(u):
+                index = users.index(u)
+                res = process_user(u, lib_map, index, recs[u['Id']], snap)
+                ctx = contexts.get(u['Id'])
+                # Only a complete result is reusable (a failed overlay leaves a category out)
+                if ctx and ctx.get("stats") is not None and set(expected) <= set(recs[u['Id']]):
+                    fp = user_fingerprint(u, index, ctx["stats"], versions, settings)
+                    try: save_user_recs(u['Id'], fp, recs[u['Id']])
+                    except Exception as e: logging.warning(f"[!] Could not store recommendations for {u['Name']}: {e}")
+                progress_advance()
+                return res
+            
+            # 3. Materialize folders & register libraries
+            with run_stage("process", len(dirty)):
+                load_source_index(fresh=full)
+                for res in ex.map(process_and_record, dirty): 
+                    if res: logging.info(f"    [DONE] {res}")
+            with run_stage("reused", len(idle)):
+                by_id = {cat: {i["Id"]: i for i in items} for cat, items in catalog.items()}
+                def refresh_and_count(u):
+                    try: refresh_reused(u, lib_map, stored[u['Id']][1], by_id)
+                    except Exception as e: logging.warning(f"[!] Could not refresh folders for {u['Name']}: {e}")
+                    progress_advance()
+                list(ex.map(refresh_and_count, [u for u in users if u['Id'] in idle]))
+                save_source_index()
+            log_http_stats("libraries")
         
-        apply_strict_privacy()
+        with run_stage("privacy"): apply_strict_privacy(snap)
         
         # Clear status file on success so dashboard knows we are healthy
         if os.path.exists(utils.STATUS_FILE):
              try: os.remove(utils.STATUS_FILE)
              except: pass
              
+        log_http_stats("run")
         logging.info("[*] Run Complete.")
         send_notification("JellyDiscover", "Run Complete!")
     except Exception as e:
         fatal(f"Unexpected error during run: {e}")
+    finally:
+        api.observer = None
+        METRICS.set_controller(api.stats())
+        try: METRICS.save()
+        except Exception as e: logging.warning(f"[!] Could not save run metrics: {e}")
+
+# --------------------------------------------------
+# MAINTENANCE (Scheduled, non-destructive)
+# --------------------------------------------------
+def run_maintenance():
+    """Housekeeping: drops ghost library Ids from policies and prunes orphaned rows from jelly_data.db."""
+    global CONFIG
+    CONFIG = utils.load_config()
+    api.configure(CONFIG.get("JELLYFIN_URL", ""), CONFIG.get("API_KEY", ""))
+    logging.info("[*] Maintenance: auditing policies and local state...")
+    init_db()
+    try: snap = RunSnapshot().load()
+    except Exception as e:
+        logging.error(f"[!] Maintenance skipped, Jellyfin unreachable: {e}")
+        return
+
+    # 1. Ghost library Ids (deleted libraries still listed in EnabledFolders)
+    real_ids = {l.get("ItemId") for l in snap.library_list()}
+    def plan(policy):
+        enabled = policy.get("EnabledFolders") or []
+        if all(i in real_ids for i in enabled): return None
+        return {"EnabledFolders": [i for i in enabled if i in real_ids]}
+    changed, _ = sync_policies(snap.users, lambda u: plan)
+    logging.info(f"    - Ghost folders removed for {len(changed)} users")
+
+    # 2. Orphaned rows: folders that no longer exist, profiles of deleted users
+    user_ids = {u['Id'] for u in snap.users}
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        roots = [r for (r,) in conn.execute("SELECT DISTINCT root FROM manifest") if not os.path.isdir(r)]
+        conn.executemany("DELETE FROM manifest WHERE root = ?", [(r,) for r in roots])
+        dirs = [d for (d,) in conn.execute("SELECT dir FROM source_index") if not os.path.isdir(d)]
+        conn.executemany("DELETE FROM source_index WHERE dir = ?", [(d,) for d in dirs])
+        profiles = [u for (u,) in conn.execute("SELECT user_id FROM user_prefs") if u not in user_ids]
+        conn.executemany("DELETE FROM user_prefs WHERE user_id = ?", [(u,) for u in profiles])
+        stored = [u for (u,) in conn.execute("SELECT user_id FROM user_recs") if u not in user_ids]
+        conn.executemany("DELETE FROM user_recs WHERE user_id = ?", [(u,) for u in stored])
+        conn.commit()
+        conn.execute("VACUUM")
+        logging.info(f"    - Pruned {len(roots)} manifests, {len(dirs)} source dirs, {len(profiles)} profiles, {len(stored)} stored recommendations")
+    finally: conn.close()
+
+# --------------------------------------------------
+# SCHEDULER (Daemon mode)
+# --------------------------------------------------
+# Jobs run at fixed slots: ANCHOR (RUN_TIME on a fixed Monday) + k * interval.
+# A job is due when its last run predates the latest slot, so a daemon that slept
+# through several slots runs the job ONCE, and weekly jobs always land on the same weekday.
+SCHEDULE_EPOCH = datetime(2024, 1, 1)  # a Monday
+JOB_ORDER = ("resync", "refresh", "maintenance")
+
+def job_intervals():
+    """Hours between runs per job (0 disables a job)."""
+    return {
+        "refresh": CONFIG.get("SCHEDULE_FREQ", 24),
+        "resync": CONFIG.get("CATALOG_RESYNC_HOURS", 168),
+        "maintenance": CONFIG.get("MAINTENANCE_HOURS", 168),
+    }
+
+def schedule_anchor():
+    try: h, m = map(int, CONFIG.get("RUN_TIME", "04:00").split(':'))
+    except: h, m = 4, 0
+    return SCHEDULE_EPOCH.replace(hour=h, minute=m)
+
+def latest_slot(now, hours):
+    step = timedelta(hours=hours)
+    anchor = schedule_anchor()
+    return anchor + step * ((now - anchor) // step)
+
+def load_job_runs():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (name TEXT PRIMARY KEY, last_run TEXT)")
+        return {n: datetime.fromisoformat(t) for n, t in conn.execute("SELECT name, last_run FROM jobs")}
+    finally: conn.close()
+
+def mark_job_run(names, when):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (name TEXT PRIMARY KEY, last_run TEXT)")
+        conn.executemany("INSERT OR REPLACE INTO jobs (name, last_run) VALUES (?, ?)", [(n, when.isoformat()) for n in names])
+        conn.commit()
+    finally: conn.close()
+
+def due_jobs(now, runs):
+    due = []
+    for name, hours in job_intervals().items():
+        if not hours or hours <= 0: continue
+        last = runs.get(name)
+        if last is None or last < latest_slot(now, hours): due.append(name)
+    # A resync is a refresh too
+    if "resync" in due and "refresh" in due: due.remove("refresh")
+    return sorted(due, key=JOB_ORDER.index)
+
+def next_wakeup(now, runs):
+    slots = [latest_slot(now, h) + timedelta(hours=h) for h in job_intervals().values() if h and h > 0]
+    return min(slots) if slots else now + timedelta(hours=1)
+
+def run_job(name):
+    """Runs one job; a fatal error ends that job, not the daemon."""
+    start_job(name)
+    try:
+        if name == "maintenance": run_maintenance()
+        else: run_task(full=(name == "resync"))
+    except SystemExit: logging.error(f"[!] Job '{name}' aborted, see the error above. Retrying at its next slot.")
+    except Exception as e: logging.error(f"[!] Job '{name}' failed: {e}")
+    finally:
+        if HEARTBEAT: HEARTBEAT.finish_stage()
+        heartbeat("idle")
+
+def run_scheduler():
+    """Daemon loop: jobs run one after another (never overlapping), each at most once per slot."""
+    global CONFIG
+    logging.info(f"[*] DAEMON ACTIVE: anchor {CONFIG.get('RUN_TIME', '04:00')}, intervals (h) {job_intervals()}")
+    while True:
+        CONFIG = utils.load_config()  # Dashboard edits apply on the next wake-up
+        now = datetime.now()
+        try: runs = load_job_runs()
+        except Exception as e:
+            logging.warning(f"[!] Could not read job history: {e}")
+            runs = {}
+        for name in due_jobs(now, runs):
+            started = datetime.now()
+            logging.info(f"[*] Scheduler: running '{name}'")
+            run_job(name)
+            try: mark_job_run([name, "refresh"] if name == "resync" else [name], started)
+            except Exception as e: logging.warning(f"[!] Could not record job run: {e}")
+            runs = {**runs, name: started}
+        # Wake at the next slot, but at least every minute so schedule edits are picked up
+        time.sleep(max(1.0, min(60.0, (next_wakeup(datetime.now(), runs) - datetime.now()).total_seconds())))
 
 def main():
-    if not acquire_lock():
-        time.sleep(1)
-        run_task()
+    global HEARTBEAT
+    print(">>> JellyDiscover Starting")
+    force_utf8()
+    elevate()
+    setup_logging()
+    job = sys.argv[sys.argv.index("--job") + 1] if "--job" in sys.argv[:-1] else None
+    daemon = not job and CONFIG.get('DAEMON_MODE', False)
+    locked = acquire_lock()
+    if not locked and (job or daemon):
+        # Scheduled runs never overlap (and must not take over the running engine's heartbeat)
+        logging.warning(f"[!] Another engine instance holds the lock. Skipping {'job ' + job if job else 'daemon start'}.")
         sys.exit(0)
+    # An unlocked manual run publishes no heartbeat: heartbeat_engine.json belongs to the lock holder
+    if locked: HEARTBEAT = utils.Heartbeat("engine", "service" if daemon else "manual").start()
     try:
-        if not CONFIG.get('DAEMON_MODE', False): run_task()
-        else:
-            r_str = CONFIG.get('RUN_TIME', "04:00")
-            logging.info(f"[*] DAEMON ACTIVE: {r_str}")
+        if not locked:
+            time.sleep(1)
+            run_task()
+            sys.exit(0)
+        if job:  # e.g. cron: engine.py --job maintenance
+            if job not in JOB_ORDER: fatal(f"Unknown job '{job}' (expected one of: {', '.join(JOB_ORDER)})")
+            started = datetime.now()
+            run_job(job)
+            mark_job_run([job, "refresh"] if job == "resync" else [job], started)
+        elif not daemon:
+            start_job("refresh")
             run_task()
-            while True:
-                h, m = map(int, r_str.split(':'))
-                now = datetime.now()
-                t = now.replace(hour=h, minute=m, second=0)
-                if t <= now: t += timedelta(days=1)
-                time.sleep((t - now).total_seconds())
-                run_task()
+        else: run_scheduler()
     except KeyboardInterrupt: pass
+    finally:
+        if HEARTBEAT: HEARTBEAT.stop()
 
-if __name__ == "__main__": main()
\ No newline at end of file
+if __name__ == "__main__": main()
@@ -0,0 +1,321 @@
+"""
+Async Jellyfin Client (Shared by Engine & Cleaner).
+
+Every HTTP call runs on ONE asyncio event loop living in a background thread.
+Concurrency is bounded per host (connection pool) and per endpoint
+(semaphores keyed by method + path with Ids collapsed), so hundreds of user,
+policy and item requests can be in flight without one OS thread each.
+
+On top of those static caps, an AIMD controller (AdaptiveLimiter) sets how
+many requests may be in flight overall: it grows by one per healthy round and
+halves on 429/5xx/timeouts or when latency exceeds the target, so a locked-up
+Jellyfin SQLite database gets backed off instead of hammered.
+
+Synchronous code uses the blocking facade (get/post/delete/iter_items/gather),
+which schedules onto the loop. aiohttp is used when installed; otherwise
+requests runs inside a bounded executor behind the same interface.
+"""
+import asyncio
+import json
+import re
+import time
+import threading
+import concurrent.futures
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency
+    aiohttp = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Paging order: Jellyfin has no Id sort key, DateCreated breaks SortName ties
+PAGE_SORT = "SortName,DateCreated"
+
+# Jellyfin Ids are 32 hex chars (or dashed GUIDs)
+ID_SEGMENT = re.compile(r"/(?:[0-9a-fA-F]{32}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})(?=/|$)")
+
+def endpoint_key(method, path):
+    """Collapses Ids so '/Users/<a>/Policy' and '/Users/<b>/Policy' share one limit."""
+    return f"{method.upper()} {ID_SEGMENT.sub('/{id}', path)}"
+
+class RequestTimeout(Exception):
+    """Raised when Jellyfin does not answer within the request timeout."""
+
+class HTTPError(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} for {response.url}")
+        self.response = response
+
+class Response:
+    """Minimal requests-like response (status_code / ok / content / json())."""
+    def __init__(self, status_code, content, url=""):
+        self.status_code = status_code
+        self.content = content or b""
+        self.url = url
+
+    @property
+    def ok(self): return self.status_code < 400
+
+    def json(self): return json.loads(self.content) if self.content else None
+
+    def raise_for_status(self):
+        if not self.ok: raise HTTPError(self)
+
+def encode_params(params):
+    """Flattens params to (key, str) pairs; lists repeat the key like requests does."""
+    pairs = []
+    for k, v in (params or {}).items():
+        if v is None: continue
+        for item in (v if isinstance(v, (list, tuple)) else [v]):
+            pairs.append((k, str(item).lower() if isinstance(item, bool) else str(item)))
+    return pairs
+
+class AdaptiveLimiter:
+    """
+    AIMD in-flight limit. Additive increase: +1 after `limit` consecutive healthy
+    responses while the limit is actually saturated. Multiplicative decrease: x0.5 on 429/5xx/timeout or a response slower
+    than `target_latency` (at most once per `cooldown` seconds so one burst of slow
+    replies does not collapse the limit to the floor).
+    """
+    def __init__(self, initial, minimum=1, maximum=32, target_latency=2.0, cooldown=1.0, window=500):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.counts = {"requests": 0, "throttled": 0, "errors": 0, "increases": 0, "decreases": 0}
+        self._healthy = 0
+        self._last_decrease = 0.0
+        self._cond = None
+
+    def _condition(self):
+        if self._cond is None: self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency, status=None):
+        """`status` None means the request failed without a response (timeout/connection error)."""
+        self.counts["requests"] += 1
+        if latency is not None: self.latencies.append(latency)
+        congested = status is None or status == 429 or status >= 500
+        if status == 429: self.counts["throttled"] += 1
+        elif congested: self.counts["errors"] += 1
+        if congested or (latency is not None and latency > self.target_latency):
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown and self.limit > self.minimum:
+                self.limit = max(self.minimum, self.limit * 0.5)
+                self._last_decrease = now
+                self.counts["decreases"] += 1
+            self._healthy = 0
+        else:
+            # Only grow when callers are queueing behind the limit; serial traffic proves nothing
+            if self.in_flight >= int(self.limit): self._healthy += 1
+            if self._healthy >= int(self.limit) and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1)
+                self._healthy = 0
+                self.counts["increases"] += 1
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def reset_stats(self):
+        """Clears counters and latency samples (the learned limit is kept across runs)."""
+        self.latencies.clear()
+        self.counts = dict.fromkeys(self.counts, 0)
+
+    def percentile(self, q):
+        if not self.latencies: return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        return {
+            "concurrency": int(self.limit), "in_flight": self.in_flight,
+            "p50": round(self.percentile(0.50), 3), "p95": round(self.percentile(0.95), 3), "p99": round(self.percentile(0.99), 3),
+            **self.counts
+        }
+
+class JellyfinClient:
+    def __init__(self, base_url, api_key, timeout=60, max_connections=32, endpoint_limits=None,
+                 retries=3, backoff=0.2, retry_statuses=RETRY_STATUSES,
+                 adaptive=True, initial_concurrency=4, target_latency=2.0):
+        self.base_url = (base_url or "").rstrip("/")
+        self.api_key = api_key or ""
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_statuses = tuple(retry_statuses)
+        # Optional hook called as observer(endpoint, status, seconds, nbytes) after every attempt
+        # (status is None when no response arrived); used for run metrics.
+        self.observer = None
+        if adaptive: self.limiter = AdaptiveLimiter(initial_concurrency, 1, max_connections, target_latency)
+        else: self.limiter = AdaptiveLimiter(max_connections, max_connections, max_connections, target_latency)
+
+        self._semaphores = {}
+        self._session = None
+        self._pool = None
+        self._requests = None
+        self.loop = asyncio.new_event_loop()
+        # Started on first use: building a client at import time (e.g. in a spawned worker) costs no thread
+        self._thread = threading.Thread(target=self.loop.run_forever, name="jellyfin-client", daemon=True)
+        self._start_lock = threading.Lock()
+
+    # --- CONFIG ---
+    def configure(self, base_url=None, api_key=None):
+        """Hot-reloads URL / API key (dashboard changes) without rebuilding the pool."""
+        if base_url is not None: self.base_url = base_url.rstrip("/")
+        if api_key is not None: self.api_key = api_key
+
+    @property
+    def headers(self):
+        return {"X-Emby-Token": self.api_key, "Content-Type": "application/json"}
+
+    def _semaphore(self, key):
+        sem = self._semaphores.get(key)
+        if sem is None:
+            sem = self._semaphores[key] = asyncio.Semaphore(self.endpoint_limits.get(key, self.max_connections))
+        return sem
+
+    # --- TRANSPORT ---
+    async def _send(self, method, url, params, body, timeout):
+        if aiohttp is not None:
+            if self._session is None:
+                connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+                self._session = aiohttp.ClientSession(connector=connector)
+            try:
+                async with self._session.request(method, url, params=params, json=body, headers=self.headers,
+                                                 timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                    return Response(r.status, await r.read(), str(r.url))
+            except asyncio.TimeoutError as e: raise RequestTimeout(f"{method} {url} timed out after {timeout}s") from e
+
+        # Fallback: blocking requests inside a bounded executor (same limits, same interface)
+        if self._requests is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="jellyfin-io")
+            self._requests = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_connections, pool_maxsize=self.max_connections)
+            self._requests.mount("http://", adapter)
+            self._requests.mount("https://", adapter)
+        def call():
+            kwargs = {"params": params, "headers": self.headers, "timeout": timeout}
+            if body is not None: kwargs["json"] = body
+            try: r = self._requests.request(method, url, **kwargs)
+            except requests.exceptions.Timeout as e: raise RequestTimeout(f"{method} {url} timed out after {timeout}s") from e
+            return Response(r.status_code, r.content, url)
+        return await self.loop.run_in_executor(self._pool, call)
+
+    async def request(self, method, path, params=None, json=None, timeout=None):
+        """Sends one request with per-endpoint limiting and retry/backoff on 429/5xx."""
+        url = f"{self.base_url}{path}"
+        query = encode_params(params)
+        key = endpoint_key(method, path)
+        async with self._semaphore(key):
+            for attempt in range(self.retries + 1):
+                await self.limiter.acquire()
+                started = time.monotonic()
+                try:
+                    resp = await self._send(method, url, query, json, timeout or self.timeout)
+                except BaseException as e:
+                    await self.limiter.release(time.monotonic() - started, None)
+                    self._observe(key, None, time.monotonic() - started, 0)
+                    retryable = isinstance(e, (RequestTimeout, OSError)) or (aiohttp is not None and isinstance(e, aiohttp.ClientError))
+                    if not retryable or attempt == self.retries: raise
+                else:
+                    await self.limiter.release(time.monotonic() - started, resp.status_code)
+                    self._observe(key, resp.status_code, time.monotonic() - started, len(resp.content))
+                    if resp.status_code not in self.retry_statuses or attempt == self.retries: return resp
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    def _observe(self, key, status, seconds, nbytes):
+        if self.observer is None: return
+        try: self.observer(key, status, seconds, nbytes)
+        except Exception: pass
+
+    async def aget(self, path, params=None, timeout=None): return await self.request("GET", path, params, timeout=timeout)
+    async def apost(self, path, params=None, json=None, timeout=None): return await self.request("POST", path, params, json, timeout)
+    async def adelete(self, path, params=None, timeout=None): return await self.request("DELETE", path, params, timeout=timeout)
+
+    async def aiter_pages(self, path, params, page_size=500, timeout=None):
+        """
+        Async pager over StartIndex/Limit; the next page is requested while the current one is consumed.
+        Without SortBy Jellyfin applies no ORDER BY, so page boundaries could shift between requests:
+        a deterministic order is added unless the caller picked one.
+        """
+        if "SortBy" not in params: params = {**params, "SortBy": PAGE_SORT, "SortOrder": "Ascending"}
+        def fetch(start):
+            query = {**params, "StartIndex": start, "Limit": page_size, "EnableTotalRecordCount": "false"}
+            return asyncio.ensure_future(self.aget(path, query, timeout))
+        start, pending = 0, fetch(0)
+        while pending is not None:
+            resp = await pending
+            resp.raise_for_status()
+            page = (resp.json() or {}).get("Items", [])
+            start += page_size
+            pending = fetch(start) if len(page) >= page_size else None
+            try: yield page
+            except BaseException:
+                if pending is not None: pending.cancel()
+                raise
+
+    async def aiter_items(self, path, params, page_size=500, timeout=None):
+        async for page in self.aiter_pages(path, params, page_size, timeout):
+            for item in page: yield item
+
+    def reset_stats(self): self.limiter.reset_stats()
+
+    def stats(self):
+        """Current concurrency, in-flight count, latency percentiles (s) and 429/5xx counters."""
+        return self.limiter.stats()
+
+    # --- BLOCKING FACADE ---
+    def run(self, coro):
+        """Runs a coroutine on the client loop and waits for the result (call from any thread but the loop's)."""
+        if self._thread.ident is None:
+            with self._start_lock:
+                if self._thread.ident is None: self._thread.start()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("JellyfinClient.run() called from the client loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get(self, path, params=None, timeout=None): return self.run(self.aget(path, params, timeout))
+    def post(self, path, params=None, json=None, timeout=None): return self.run(self.apost(path, params, json, timeout))
+    def delete(self, path, params=None, timeout=None): return self.run(self.adelete(path, params, timeout))
+
+    def gather(self, coros, return_exceptions=True):
+        """Runs many coroutines concurrently (bounded by the endpoint limits); results keep input order."""
+        async def _all(): return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+        return self.run(_all())
+
+    def iter_items(self, path, params, page_size=500, timeout=None):
+        """Blocking generator over aiter_pages (one loop hop per page, pages still prefetch)."""
+        agen = self.aiter_pages(path, params, page_size, timeout)
+        try:
+            while True:
+                try: page = self.run(agen.__anext__())
+                except StopAsyncIteration: return
+                yield from page
+        finally:
+            try: self.run(agen.aclose())
+            except Exception: pass
+
+    def close(self):
+        if self._thread.ident is None: return  # Never used
+        async def _close():
+            if self._session is not None: await self._session.close()
+        try: self.run(_close())
+        except Exception: pass
+        if self._pool is not None: self._pool.shutdown(wait=False)
+        self.loop.call_soon_threadsafe(self.loop.stop)
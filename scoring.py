@@ -0,0 +1,221 @@
+"""
+Vectorized Scoring Engine (NumPy).
+
+Encodes one category's catalog as sparse genre/actor/director/collection
+feature matrices and scores a whole batch of users against it with array
+operations. The maths mirrors engine.score_item exactly; NumPy is optional and
+the engine falls back to the pure-Python scorer when it is not installed.
+
+This module has no side effects on import (no config, logging or network),
+so it is safe to load from worker processes.
+"""
+import os
+import pickle
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+KINDS = ("genres", "actors", "directors")
+MUSIC_TYPES = ("MusicAlbum", "Audio")
+
+# Upper bound on the temporary (users x non-zeros) block built per feature kind
+BATCH_ELEMENTS = 8_000_000
+
+def available():
+    return np is not None
+
+# --------------------------------------------------
+# DETERMINISTIC JITTER
+# --------------------------------------------------
+# Diversity jitter is derived from a (user, item, run) seed instead of the global RNG,
+# so an item gets ONE score per run and a run can be reproduced from its run id.
+MASK64 = (1 << 64) - 1
+COLD_SALT = 0x5BD1E9955BD1E995
+
+def stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(str(text).encode("utf-8"), digest_size=8).digest(), "little")
+
+def user_seed(run_id, user_id):
+    return stable_hash(f"{run_id}:{user_id}")
+
+def mix64(x):
+    """SplitMix64 finaliser (pure Python twin of _mix64_array)."""
+    z = (x + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+def unit(seed, item_key):
+    """Uniform float in [0, 1) for one (seed, item) pair."""
+    return (mix64(seed ^ item_key) >> 11) * (1.0 / (1 << 53))
+
+def _mix64_array(x):
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def unit_array(seed, item_keys):
+    with np.errstate(over="ignore"):
+        return (_mix64_array(item_keys ^ np.uint64(seed)) >> np.uint64(11)) * (1.0 / (1 << 53))
+
+def item_features(item):
+    """Yields (kind, name) pairs exactly as score_item walks them (duplicates count twice)."""
+    if hasattr(item, "features"):  # compact catalog record
+        yield from item.features()
+        return
+    for g in item.get("Genres", []): yield "genres", g
+    for p in item.get("People", []):
+        if p["Type"] == "Director": yield "directors", p["Name"]
+        elif p["Type"] == "Actor": yield "actors", p["Name"]
+
+class CategoryMatrix:
+    """Sparse (CSR) feature encoding of one category's candidate list."""
+
+    def __init__(self, items):
+        n = len(items)
+        self.size = n
+        self.index = {i["Id"]: r for r, i in enumerate(items)}
+        self.keys = np.fromiter((stable_hash(i["Id"]) for i in items), np.uint64, n)
+        self.vocab = {k: {} for k in KINDS}
+        self.collection_vocab = {}
+
+        cols = {k: [] for k in KINDS}
+        counts = {k: np.zeros(n, np.int64) for k in KINDS}
+        self.rating = np.zeros(n)
+        self.music = np.zeros(n, bool)
+        self.played = np.zeros(n, bool)
+        self.collection = np.full(n, -1, np.int64)
+
+        for r, item in enumerate(items):
+            for kind, name in item_features(item):
+                vocab = self.vocab[kind]
+                cols[kind].append(vocab.setdefault(name, len(vocab)))
+                counts[kind][r] += 1
+            rating = item.get("CommunityRating", 0) or 0
+            self.rating[r] = rating if rating > 0 else 0.0
+            self.music[r] = item.get("Type") in MUSIC_TYPES
+            self.played[r] = bool((item.get("UserData") or {}).get("Played"))
+            name = item.get("CollectionName")
+            if name: self.collection[r] = self.collection_vocab.setdefault(name, len(self.collection_vocab))
+
+        # CSR layout: column indices are already grouped by row; reduceat needs the
+        # start offset of every NON-empty row (empty rows simply keep a zero affinity).
+        self.cols, self.rows_nz, self.starts = {}, {}, {}
+        for kind in KINDS:
+            indptr = np.concatenate(([0], np.cumsum(counts[kind])))
+            nonempty = counts[kind] > 0
+            self.cols[kind] = np.asarray(cols[kind], np.int64)
+            self.rows_nz[kind] = np.flatnonzero(nonempty)
+            self.starts[kind] = indptr[:-1][nonempty]
+        self.nnz = sum(len(c) for c in self.cols.values())
+
+        # Baselines shared by every user
+        self.warm_base = np.where(self.rating > 0, self.rating, np.where(self.music, 7.0, 5.0))
+        self.cold_base = np.where(self.rating > 0, self.rating + 2.0, 0.0)
+        self.cold_music = (self.rating <= 0) & self.music
+
+    def lookup(self, ids):
+        """Row indices for a collection of item Ids (unknown Ids are ignored)."""
+        return np.fromiter((self.index[i] for i in ids if i in self.index), np.int64)
+
+    def _weight_matrix(self, kind, prefs_list):
+        """Encodes each user's preference dict for `kind` as a dense weight row over the vocab."""
+        vocab = self.vocab[kind]
+        W = np.zeros((len(prefs_list), len(vocab)))
+        for u, prefs in enumerate(prefs_list):
+            for name, v in prefs[kind].items():
+                j = vocab.get(name)
+                if j is not None: W[u, j] = v
+        return W
+
+    def _affinity(self, kind, W):
+        """(users x vocab) @ (vocab x items) through the CSR structure."""
+        out = np.zeros((W.shape[0], self.size))
+        if self.starts[kind].size:
+            out[:, self.rows_nz[kind]] = np.add.reduceat(W[:, self.cols[kind]], self.starts[kind], axis=1)
+        return out
+
+    def score_users(self, profiles, weights):
+        """
+        Scores every profile against the whole category.
+        `profiles` is a list of (prefs, cold, seed) tuples; yields (position, scores) per user,
+        processing users in blocks sized to keep the temporary matrices bounded.
+        """
+        block = max(1, BATCH_ELEMENTS // max(self.nnz, self.size, 1))
+        for lo in range(0, len(profiles), block):
+            chunk = profiles[lo:lo + block]
+            warm = [u for u, (_, cold, _) in enumerate(chunk) if not cold]
+            S = np.empty((len(chunk), self.size))
+            if warm:
+                prefs_list = [chunk[u][0] for u in warm]
+                Sw = np.repeat(self.warm_base[None, :], len(warm), axis=0)
+                for kind in KINDS:
+                    Sw += self._affinity(kind, self._weight_matrix(kind, prefs_list)) * weights[kind]
+                for row, prefs in enumerate(prefs_list):
+                    liked = [c for name, c in self.collection_vocab.items() if name in prefs["collections"]]
+                    if liked: Sw[row] += np.isin(self.collection, liked) * weights["collection"]
+                Sw -= self.played * weights["seen_penalty"]
+                S[warm] = Sw
+            for u, (_, cold, seed) in enumerate(chunk):
+                if cold:
+                    S[u] = self.cold_base
+                    S[u, self.cold_music] = 6.5 + 3.0 * unit_array(seed ^ COLD_SALT, self.keys[self.cold_music])
+                S[u] += weights["diversity"] * unit_array(seed, self.keys)
+                yield lo + u, S[u]
+
+    # --- SHARED (memory-mapped) COPY FOR WORKER PROCESSES ---
+    ARRAYS = ("keys", "rating", "music", "played", "collection", "warm_base", "cold_base", "cold_music")
+
+    def export(self, path):
+        """Writes the read-only arrays as .npy files (memory-mapped by attach) plus a small vocab pickle."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS: np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        for kind in KINDS:
+            for name in ("cols", "rows_nz", "starts"): np.save(os.path.join(path, f"{name}.{kind}.npy"), getattr(self, name)[kind])
+        with open(os.path.join(path, "meta.pickle"), "wb") as f:
+            pickle.dump({"size": self.size, "nnz": self.nnz, "vocab": self.vocab, "collection_vocab": self.collection_vocab}, f)
+        return path
+
+    @classmethod
+    def attach(cls, path):
+        """Matrix backed by an exported directory: arrays are mapped, not copied, so the page cache is shared."""
+        self = cls.__new__(cls)
+        with open(os.path.join(path, "meta.pickle"), "rb") as f: self.__dict__.update(pickle.load(f))
+        self.index = None  # Id lookups stay in the parent
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in cls.ARRAYS: setattr(self, name, load(name))
+        for name in ("cols", "rows_nz", "starts"): setattr(self, name, {kind: load(f"{name}.{kind}") for kind in KINDS})
+        return self
+
+# --------------------------------------------------
+# PROCESS POOL WORKERS
+# --------------------------------------------------
+# Each worker maps an exported category once and scores its shard of users; only
+# profiles go in and only top-k row indices come back, never the catalog itself.
+_attached = {}
+
+def score_shard(path, profiles, weights, min_score, k, excludes):
+    """Worker entry point: returns [(position in shard, top-k row indices)]."""
+    matrix = _attached.get(path)
+    if matrix is None:
+        _attached.clear()
+        matrix = _attached[path] = CategoryMatrix.attach(path)
+    return [(pos, top_k(scores, min_score, k, exclude=excludes[pos]).tolist())
+            for pos, scores in matrix.score_users(profiles, weights)]
+
+def shards(n, workers, per_worker=4):
+    """Splits range(n) into contiguous slices, a few per worker so uneven shards balance out."""
+    size = max(1, -(-n // (workers * per_worker)))
+    return [slice(lo, min(n, lo + size)) for lo in range(0, n, size)]
+
+def top_k(scores, min_score, k, exclude=None):
+    """Row indices of the k best scores >= min_score, best first."""
+    mask = scores >= min_score
+    if exclude is not None and len(exclude): mask[exclude] = False
+    cand = np.flatnonzero(mask)
+    if len(cand) > k: cand = cand[np.argpartition(-scores[cand], k - 1)[:k]]
+    return cand[np.argsort(-scores[cand], kind="stable")]
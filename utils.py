@@ -5,6 +5,15 @@ import platform
 import datetime
 import glob
 import shutil
+import sqlite3
+import threading
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # ==========================================
 # 1. CORE PATH & PLATFORM LOGIC
@@ -19,7 +28,10 @@ else:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # PLATFORM PATH SELECTION
-if IS_WINDOWS:
+if os.environ.get('JELLYDISCOVER_DATA_DIR'):
+    # Explicit override (benchmarks, portable installs)
+    DATA_DIR = os.path.abspath(os.environ['JELLYDISCOVER_DATA_DIR'])
+elif IS_WINDOWS:
     # Windows: Force ProgramData to avoid PermissionErrors in Program Files
     DATA_DIR = os.path.join(os.environ.get('ProgramData', 'C:\\ProgramData'), 'JellyDiscover')
 elif IS_DOCKER:
@@ -36,6 +48,7 @@ CONFIG_PATH = os.path.join(DATA_DIR, 'config.json')
 LIBRARIES_PATH = os.path.join(DATA_DIR, 'libraries.json')
 LOG_DIR = os.path.join(DATA_DIR, 'logs')
 STATUS_FILE = os.path.join(DATA_DIR, 'status.json')
+DB_PATH = os.path.join(DATA_DIR, 'jelly_data.db')
 
 # Ensure directories exist immediately
 try:
@@ -53,8 +66,18 @@ def load_config():
         "JELLYFIN_URL": "http://localhost:8096",
         "API_KEY": "",
         "MAX_THREADS": 2,
+        "SCORING_PROCESSES": 0,
+        "PAGE_SIZE": 500,
+        "HTTP_MAX_CONNECTIONS": 32,
+        "HTTP_ENDPOINT_LIMITS": {},
+        "HTTP_ADAPTIVE": True,
+        "HTTP_TARGET_LATENCY": 2.0,
+        "PROFILE_REBUILD_DAYS": 30,
+        "STABLE_LIBRARIES": False,
         "RUN_TIME": "04:00",
         "SCHEDULE_FREQ": 24,
+        "CATALOG_RESYNC_HOURS": 168,
+        "MAINTENANCE_HOURS": 168,
         "DASHBOARD_PORT": 5000,
         "PATH_SUBSTITUTIONS": {},
         "USE_NETWORK_DRIVE": False,
@@ -157,16 +180,336 @@ def get_last_status():
             status["last_run"] = dt.strftime("%Y-%m-%d %H:%M:%S")
         except: pass
 
-        with open(latest_file, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-            for line in lines:
+        # Only the bytes appended since the last call are scanned (see scan_log_errors)
+        entry = scan_log_errors(latest_file)
+        status["success"] = entry["success"]
+        status["errors"] = entry["errors"][:3] 
+        return status
+    except Exception as e:
+        return {"success": False, "last_run": "Error reading logs", "errors": [str(e)], "log_path": ""}
+
+# Error index: per log file, the byte offset scanned so far and the first errors found.
+# Persisted in LOG_INDEX_PATH so a dashboard restart does not rescan megabytes of log.
+LOG_INDEX_PATH = os.path.join(DATA_DIR, 'log_index.json')
+LOG_INDEX_ERRORS = 3  # Only the first few distinct errors are ever shown
+_log_index = None
+_log_index_lock = threading.Lock()
+
+def scan_log_errors(path):
+    """
+    Returns {"offset", "success", "errors"} for one log, resuming at the stored offset.
+    RotatingFileHandler rollover (new inode, shorter file or different first bytes) restarts the scan.
+    """
+    global _log_index
+    with _log_index_lock:
+        if _log_index is None:
+            try:
+                with open(LOG_INDEX_PATH, 'r', encoding='utf-8') as f: _log_index = json.load(f)
+            except: _log_index = {}
+        st = os.stat(path)
+        entry = _log_index.get(path)
+        with open(path, 'rb') as f:
+            head = f.read(64)
+            if (not entry or st.st_size < entry["offset"] or entry.get("ino") != st.st_ino
+                    or not head.startswith(bytes.fromhex(entry.get("head", "")))):
+                entry = {"offset": 0, "success": True, "errors": []}
+            if st.st_size == entry["offset"] and path in _log_index: return entry
+            f.seek(entry["offset"])
+            offset = entry["offset"]
+            for raw in f:
+                if not raw.endswith(b"\n"): break  # Unfinished line: picked up next time
+                offset += len(raw)
+                line = raw.decode('utf-8', errors='ignore')
                 if "ERROR" in line or "CRITICAL" in line or "Traceback" in line:
-                    status["success"] = False
+                    entry["success"] = False
                     clean_err = line.split("ERROR")[-1].strip() if "ERROR" in line else line.strip()
-                    if clean_err not in status["errors"]:
-                        status["errors"].append(clean_err)
+                    if clean_err not in entry["errors"] and len(entry["errors"]) < LOG_INDEX_ERRORS:
+                        entry["errors"].append(clean_err)
+        entry.update(offset=offset, ino=st.st_ino, head=head.hex())
+        _log_index = {p: e for p, e in _log_index.items() if p != path and os.path.exists(p)}
+        _log_index[path] = entry
+        try: write_json_atomic(LOG_INDEX_PATH, _log_index)
+        except: pass
+        return entry
 
-        status["errors"] = status["errors"][:3] 
-        return status
-    except Exception as e:
-        return {"success": False, "last_run": "Error reading logs", "errors": [str(e)], "log_path": ""}
\ No newline at end of file
+def tail_log(path, lines=100, block=8192):
+    """Last `lines` lines, read backwards from the end in blocks; returns (text, file size = stream offset)."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= lines:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    text = data.decode("utf-8", errors="ignore")
+    return "".join(text.splitlines(keepends=True)[-lines:]), size
+
+def read_log_since(path, offset, limit=256 * 1024):
+    """
+    Complete lines appended after byte `offset`; returns (text, new offset).
+    A file shorter than the offset was rotated (RotatingFileHandler): read from its start.
+    """
+    size = os.path.getsize(path)
+    if size < offset: offset = 0
+    if size == offset: return "", offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(min(limit, size - offset))
+    cut = data.rfind(b"\n") + 1
+    if not cut:
+        if len(data) < limit: return "", offset  # Wait for the line to be finished
+        cut = len(data)
+    return data[:cut].decode("utf-8", errors="ignore"), offset + cut
+
+# ==========================================
+# 4. RUN METRICS
+# ==========================================
+
+METRICS_HISTORY = 500  # Runs kept in run_metrics (per job)
+
+def peak_rss_mb():
+    """Process high-water RSS so far (None where the resource module is missing)."""
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class RunMetrics:
+    """
+    Thread-safe timings and counters for one engine/cleaner run.
+    Stages opened from several worker threads accumulate (summed worker time).
+    """
+    def __init__(self, job, run_id=None):
+        self.job = job
+        self.run_id = run_id or datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.users = {}
+        self.http = {}
+        self.controller = {}
+        self.stage_requests = {}
+        self.stage_files = {}
+        self.stage_peak_rss = {}
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0, r0, f0 = time.perf_counter(), self._requests, self.counters.get("files_written", 0)
+        try: yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            rss = peak_rss_mb()
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+                self.stage_requests[name] = self.stage_requests.get(name, 0) + self._requests - r0
+                self.stage_files[name] = self.stage_files.get(name, 0) + self.counters.get("files_written", 0) - f0
+                # High-water mark when the stage ended: the stage that raised it is where memory went
+                if rss is not None: self.stage_peak_rss[name] = max(self.stage_peak_rss.get(name, 0.0), rss)
+
+    def add(self, name, value=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + value
+
+    def user_time(self, user, seconds):
+        with self._lock: self.users[user] = self.users.get(user, 0.0) + seconds
+
+    def record_http(self, endpoint, status, seconds, nbytes):
+        """JellyfinClient observer hook."""
+        with self._lock:
+            self._requests += 1
+            h = self.http.setdefault(endpoint, {"requests": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0})
+            h["requests"] += 1
+            if status is None or status >= 400: h["errors"] += 1
+            h["seconds"] += seconds
+            h["max_seconds"] = max(h["max_seconds"], seconds)
+            h["bytes"] += nbytes
+
+    def set_controller(self, stats):
+        """End-of-run snapshot of the adaptive HTTP limiter (JellyfinClient.stats())."""
+        with self._lock: self.controller = dict(stats)
+
+    def to_dict(self):
+        with self._lock:
+            return {"run_id": self.run_id, "job": self.job, "started": self.started, "duration": time.time() - self.started,
+                    "stages": dict(self.stages), "stage_requests": dict(self.stage_requests), "stage_files": dict(self.stage_files),
+                    "stage_peak_rss_mb": dict(self.stage_peak_rss), "counters": dict(self.counters), "users": dict(self.users),
+                    "http": {k: dict(v) for k, v in self.http.items()}, "controller": dict(self.controller)}
+
+    def save(self, db_path=None):
+        data = self.to_dict()
+        conn = sqlite3.connect(db_path or DB_PATH, timeout=30)
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS run_metrics (run_id TEXT, job TEXT, started REAL, duration REAL, data TEXT, PRIMARY KEY (run_id, job))")
+            conn.execute("INSERT OR REPLACE INTO run_metrics (run_id, job, started, duration, data) VALUES (?, ?, ?, ?, ?)",
+                         (self.run_id, self.job, data["started"], data["duration"], json.dumps(data)))
+            conn.execute("DELETE FROM run_metrics WHERE job = ? AND run_id NOT IN (SELECT run_id FROM run_metrics WHERE job = ? ORDER BY started DESC LIMIT ?)",
+                         (self.job, self.job, METRICS_HISTORY))
+            conn.commit()
+        finally: conn.close()
+        return data
+
+def load_run_metrics(job=None, limit=1):
+    """Newest persisted runs first (optionally for one job)."""
+    if not os.path.exists(DB_PATH): return []
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        query, args = "SELECT data FROM run_metrics", ()
+        if job: query, args = query + " WHERE job = ?", (job,)
+        rows = conn.execute(query + " ORDER BY started DESC LIMIT ?", args + (limit,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+    except sqlite3.Error: return []
+    finally: conn.close()
+
+def _prom_labels(**labels):
+    esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+def render_prometheus():
+    """Prometheus text exposition of the latest engine and cleaner runs."""
+    metrics = {}
+    def put(name, help_text, labels, value):
+        metrics.setdefault(name, (help_text, []))[1].append(f"{name}{_prom_labels(**labels)} {value}")
+
+    for job in ("engine", "cleaner"):
+        runs = load_run_metrics(job)
+        if not runs: continue
+        run = runs[0]
+        put("jellydiscover_last_run_timestamp_seconds", "Start time of the last run.", {"job": job}, run["started"])
+        put("jellydiscover_run_duration_seconds", "Wall time of the last run.", {"job": job}, round(run["duration"], 3))
+        for stage, sec in run["stages"].items():
+            put("jellydiscover_stage_duration_seconds", "Time per stage in the last run (summed over workers).", {"job": job, "stage": stage}, round(sec, 3))
+        for stage, n in run.get("stage_requests", {}).items():
+            put("jellydiscover_stage_http_requests", "HTTP requests issued while a stage was running.", {"job": job, "stage": stage}, n)
+        for name, value in run["counters"].items():
+            put(f"jellydiscover_{name}", f"{name.replace('_', ' ').capitalize()} in the last run.", {"job": job}, value)
+        for user, sec in run["users"].items():
+            put("jellydiscover_user_duration_seconds", "Processing time per user in the last run.", {"job": job, "user": user}, round(sec, 3))
+        for endpoint, h in run["http"].items():
+            labels = {"job": job, "endpoint": endpoint}
+            put("jellydiscover_http_requests", "HTTP requests per endpoint in the last run.", labels, h["requests"])
+            put("jellydiscover_http_errors", "Failed HTTP requests (no response or status >= 400) per endpoint.", labels, h["errors"])
+            put("jellydiscover_http_latency_seconds_sum", "Total HTTP latency per endpoint.", labels, round(h["seconds"], 4))
+            put("jellydiscover_http_latency_seconds_max", "Slowest HTTP request per endpoint.", labels, round(h["max_seconds"], 4))
+            put("jellydiscover_http_response_bytes", "Response bytes per endpoint.", labels, h["bytes"])
+        c = run.get("controller") or {}
+        if c:
+            put("jellydiscover_http_concurrency", "Adaptive concurrency limit at the end of the last run.", {"job": job}, c["concurrency"])
+            for q in ("p50", "p95", "p99"):
+                put("jellydiscover_http_latency_seconds", "HTTP latency percentiles (recent window) at the end of the last run.", {"job": job, "quantile": f"0.{q[1:]}"}, c[q])
+            for key in ("increases", "decreases"):
+                put(f"jellydiscover_http_concurrency_{key}", f"Adaptive concurrency limit {key} in the last run.", {"job": job}, c.get(key, 0))
+            put("jellydiscover_http_throttled", "HTTP 429 responses seen by the adaptive limiter in the last run.", {"job": job}, c.get("throttled", 0))
+
+    out = []
+    for name, (help_text, samples) in metrics.items():
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", *samples]
+    return "\n".join(out) + "\n"
+
+# ==========================================
+# 5. HEARTBEATS (Liveness for the dashboard)
+# ==========================================
+# engine/cleaner rewrite DATA_DIR/heartbeat_<job>.json every HEARTBEAT_INTERVAL seconds
+# (temp file + os.replace, so readers never see a partial file). The dashboard answers
+# "is it running?" with one small read instead of scanning the process table.
+
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_STALE = 4 * HEARTBEAT_INTERVAL  # No beat for this long: the process hung or died
+HEARTBEAT_DONE = ("stopped", "crashed")
+
+def heartbeat_path(job):
+    return os.path.join(DATA_DIR, f"heartbeat_{job}.json")
+
+def write_json_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(data, f)
+    os.replace(tmp, path)
+
+class Heartbeat:
+    """
+    Background thread publishing {pid, mode, state, started, updated, progress} for one process.
+    The dashboard reads it for liveness instead of scanning the process table.
+    `progress` describes the running job: current stage, units done/remaining, throughput and ETA.
+    """
+    def __init__(self, job, mode="manual"):
+        self.job = job
+        self.path = heartbeat_path(job)
+        self.data = {"job": job, "pid": os.getpid(), "mode": mode, "state": "starting",
+                     "started": time.time(), "updated": None, "progress": {}}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        self.beat()
+        threading.Thread(target=self._run, name=f"heartbeat-{self.job}", daemon=True).start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL): self.beat()
+
+    def beat(self):
+        with self._lock:
+            self.data["updated"] = time.time()
+            # Windows refuses the replace while a reader holds the file: the next beat retries
+            try: write_json_atomic(self.path, self.data)
+            except: pass
+
+    def update(self, state=None, **progress):
+        """A state change is published immediately; progress goes out with the next beat."""
+        with self._lock:
+            changed = state is not None and state != self.data["state"]
+            if state is not None: self.data["state"] = state
+            self.data["progress"].update(progress)
+        if changed: self.beat()
+
+    def stop(self, state="stopped"):
+        self._stop.set()
+        self.finish_stage()
+        self.update(state)
+        self.beat()
+
+    # --- Run progress (the `progress` slot) ---
+    # {"job", "stage", "unit", "done", "total", "remaining", "rate" (units/s), "eta_seconds",
+    #  "stage_started", "stages": {finished stage: {"seconds", "done", "rate"}}}
+    def reset_progress(self, **fields):
+        with self._lock: self.data["progress"] = {"stages": {}, **fields}
+
+    def stage(self, name, total=None, unit="users"):
+        """Starts a stage (closing the previous one) and publishes it immediately."""
+        self.finish_stage()
+        with self._lock:
+            self.data["progress"].update(stage=name, unit=unit, done=0, total=total, remaining=total,
+                                         rate=None, eta_seconds=None, stage_started=time.time())
+        self.beat()
+
+    def advance(self, n=1):
+        """Counts finished units; throughput and ETA go out with the next beat."""
+        with self._lock:
+            p = self.data["progress"]
+            if not p.get("stage"): return
+            p["done"] = p.get("done", 0) + n
+            elapsed = time.time() - p["stage_started"]
+            p["rate"] = round(p["done"] / elapsed, 3) if elapsed > 0 else None
+            if p.get("total") is not None:
+                p["remaining"] = max(0, p["total"] - p["done"])
+                p["eta_seconds"] = round(p["remaining"] / p["rate"], 1) if p["rate"] else None
+
+    def finish_stage(self):
+        with self._lock:
+            p = self.data["progress"]
+            if not p.get("stage"): return
+            seconds = time.time() - p["stage_started"]
+            p.setdefault("stages", {})[p["stage"]] = {"seconds": round(seconds, 3), "done": p.get("done", 0),
+                                                      "rate": round(p.get("done", 0) / seconds, 3) if seconds > 0 else None}
+            for key in ("stage", "unit", "done", "total", "remaining", "rate", "eta_seconds", "stage_started"): p.pop(key, None)
+
+def read_heartbeat(job):
+    try:
+        with open(heartbeat_path(job), "r", encoding="utf-8") as f: return json.load(f)
+    except: return None
+
+def heartbeat_fresh(hb, now=None):
+    """True if the process announced itself as active and beat recently."""
+    if not hb or hb.get("state") in HEARTBEAT_DONE: return False
+    return (now or time.time()) - (hb.get("updated") or 0) < HEARTBEAT_STALE